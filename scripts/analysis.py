@@ -1,3 +1,8 @@
+import argparse
+import hashlib
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import matplotlib.pyplot as plt
@@ -5,79 +10,101 @@ import pandas as pd
 import plotly.graph_objects as go
 import seaborn as sns
 
-from scripts.path_operators import get_datasets_dir
+from scripts.credibility_cube import CredibilityCube
+from scripts.credibility_scoring import rank_credibility
+from scripts.path_operators import get_reports_dir
+from scripts.schemas import read_processed_dataset
+
+try:
+    import kaleido  # noqa: F401
+
+    PLOTLY_STATIC_EXPORT = True
+except ImportError:
+    PLOTLY_STATIC_EXPORT = False
+
+REPORT_MANIFEST = "report_manifest.json"
+REPORT_WORKERS = 4
 
 
 # Load the dataset
-def load_dataset(file_path):
+def load_dataset(file_path, columns=None, filters=None):
     """
-    Load the dataset from a Parquet file.
+    Load the dataset from a Parquet file or a partitioned dataset directory.
 
-    :param file_path: Path to the Parquet file
+    :param file_path: Path to the Parquet file or dataset directory
+    :param columns: Columns to read, all of them by default
+    :param filters: Optional pyarrow expression pushed down to the scan
     :return: DataFrame with the loaded data
     """
     if not Path(file_path).exists():
         raise FileNotFoundError(f"The file {file_path} does not exist.")
-    return pd.read_parquet(file_path)
+    return read_processed_dataset(file_path, columns=columns, filters=filters)
 
 
-# Normalize score
-def get_max_count(grouped):
-    max_count = grouped["count"].max()
-    grouped["normalized_score"] = grouped.apply(
-        lambda row: row["mean"] * (row["count"] / max_count)
-        + row["mean"] * (1 - row["count"] / max_count),
-        axis=1,
-    )
-    return grouped
+# Shrunk score with confidence interval, so authors with few cards don't top the rankings
+def get_shrunk_scores(cube, column):
+    # Plain strings, as categorical keys would make seaborn ignore the sorted row order
+    return rank_credibility(cube.totals(column)).astype({column: str})
 
 
 # Group by politician
-def get_normalized_score_df_grouped_by_politician(df):
-    grouped = df.groupby("author")["score"].agg(["mean", "count"]).reset_index()
-    return get_max_count(grouped)
+def get_normalized_score_df_grouped_by_politician(cube):
+    return get_shrunk_scores(cube, "author")
 
 
 # Group by party
-def get_score_df_grouped_by_party(df):
-    grouped = df.groupby("party")["score"].agg(["mean", "count"]).reset_index()
-    return get_max_count(grouped)
+def get_score_df_grouped_by_party(cube):
+    return get_shrunk_scores(cube, "party")
+
+
+# Draw the confidence intervals over a horizontal barplot, rows in the same order as the bars
+def plot_confidence_intervals(grouped):
+    plt.errorbar(
+        x=grouped["shrunk_score"],
+        y=range(len(grouped)),
+        xerr=[grouped["shrunk_score"] - grouped["ci_low"], grouped["ci_high"] - grouped["shrunk_score"]],
+        fmt="none",
+        ecolor="black",
+        capsize=3,
+    )
 
 
 # Find politician with lowest score
-def find_lowest_avg_score_by_politician(df):
-    credibility_by_politician = get_normalized_score_df_grouped_by_politician(df)
+def find_lowest_avg_score_by_politician(cube):
+    credibility_by_politician = get_normalized_score_df_grouped_by_politician(cube)
     lowest_avg_score = credibility_by_politician.loc[
-        credibility_by_politician["normalized_score"].idxmin()
+        credibility_by_politician["shrunk_score"].idxmin()
     ]
     print(
         f"The politician with the lowest average credibility score is: {lowest_avg_score['author']} with a score of "
-        f"{lowest_avg_score['normalized_score']:.2f}"
+        f"{lowest_avg_score['shrunk_score']:.2f} "
+        f"(95% CI {lowest_avg_score['ci_low']:.2f} to {lowest_avg_score['ci_high']:.2f})"
     )
 
 
 # Find party with highest score
-def find_highest_avg_score_by_party(df):
-    credibility_by_party = get_score_df_grouped_by_party(df)
+def find_highest_avg_score_by_party(cube):
+    credibility_by_party = get_score_df_grouped_by_party(cube)
     highest_avg_score = credibility_by_party.loc[
-        credibility_by_party["normalized_score"].idxmax()
+        credibility_by_party["shrunk_score"].idxmax()
     ]
     print(
         f"The party with the highest average credibility score is: {highest_avg_score['party']} with a score of "
-        f"{highest_avg_score['normalized_score']:.2f}"
+        f"{highest_avg_score['shrunk_score']:.2f} "
+        f"(95% CI {highest_avg_score['ci_low']:.2f} to {highest_avg_score['ci_high']:.2f})"
     )
 
 
 # Plot politician credibility
-def plot_credibility_by_politician(df):
-    credibility_by_politician = get_normalized_score_df_grouped_by_politician(df)
+def plot_credibility_by_politician(cube):
+    credibility_by_politician = get_normalized_score_df_grouped_by_politician(cube)
     credibility_by_politician = credibility_by_politician.sort_values(
-        by="normalized_score", ascending=False
+        by="shrunk_score", ascending=False
     )
-    plt.figure(figsize=(14, 8))
+    fig = plt.figure(figsize=(14, 8))
     sns.set_theme(style="darkgrid")
     sns.barplot(
-        x="normalized_score",
+        x="shrunk_score",
         y="author",
         hue="author",
         data=credibility_by_politician,
@@ -85,23 +112,24 @@ def plot_credibility_by_politician(df):
         dodge=False,
         legend=False,
     )
-    plt.xlabel("Normalized Average Credibility Score")
+    plot_confidence_intervals(credibility_by_politician)
+    plt.xlabel("Shrunk Average Credibility Score")
     plt.ylabel("Politician")
     plt.title("Overall Credibility by Politicians")
     plt.tight_layout()
-    plt.show()
+    return fig
 
 
 # Plot party credibility
-def plot_credibility_by_party(df):
-    credibility_by_party = get_score_df_grouped_by_party(df)
+def plot_credibility_by_party(cube):
+    credibility_by_party = get_score_df_grouped_by_party(cube)
     credibility_by_party = credibility_by_party.sort_values(
-        "normalized_score", ascending=False
+        "shrunk_score", ascending=False
     )
-    plt.figure(figsize=(14, 8))
+    fig = plt.figure(figsize=(14, 8))
     sns.set_theme(style="darkgrid")
     sns.barplot(
-        x="normalized_score",
+        x="shrunk_score",
         y="party",
         hue="party",
         data=credibility_by_party,
@@ -109,31 +137,33 @@ def plot_credibility_by_party(df):
         dodge=False,
         legend=False,
     )
-    plt.xlabel("Normalized Average Credibility Score")
+    plot_confidence_intervals(credibility_by_party)
+    plt.xlabel("Shrunk Average Credibility Score")
     plt.ylabel("Party")
     plt.title("Overall Credibility by Parties")
     plt.tight_layout()
-    plt.show()
+    return fig
 
 
 # Additional visualizations
-def plot_score_distribution(df):
-    plt.figure(figsize=(14, 8))
+def plot_score_distribution(cube):
+    fig = plt.figure(figsize=(14, 8))
     sns.set_theme(style="darkgrid")
     sns.histplot(
-        data=df, x="score", hue="author", multiple="stack", bins=10, palette="viridis"
+        data=cube.score_counts("author"), x="score", weights="n", hue="author", multiple="stack", bins=10,
+        palette="viridis"
     )
     plt.xlabel("Score")
     plt.ylabel("Count")
     plt.title("Distribution of Scores by Politicians")
     plt.legend(loc="upper right", bbox_to_anchor=(1.15, 1))
     plt.tight_layout()
-    plt.show()
+    return fig
 
 
-def plot_interactive(df, mode="light"):
-    # Calculate average scores for each politician
-    avg_scores = df.groupby("author")["score"].mean().reset_index()
+def plot_interactive(cube, mode="light"):
+    # Shrunk average scores for each politician
+    avg_scores = get_shrunk_scores(cube, "author").rename(columns={"shrunk_score": "score"})
 
     # Settings for dark or light mode
     if mode == "dark":
@@ -147,24 +177,30 @@ def plot_interactive(df, mode="light"):
         grid_color = "#cccccc"
         template = "plotly_white"
 
-    fig = go.Figure()
-
-    for i, author in enumerate(avg_scores["author"].unique()):
-        author_data = avg_scores[avg_scores["author"] == author]
-        fig.add_trace(
-            go.Bar(
-                x=author_data["score"],
-                y=author_data["author"],
-                name=author,
-                orientation="h",
-                marker=dict(
-                    line=dict(color="#000000", width=1),
-                    opacity=0.8,
-                ),
-                hoverinfo="x+y+name",
-                hoverlabel=dict(bgcolor="#ffffff", font_size=16, font_family="Roboto"),
-            )
+    avg_scores = avg_scores.sort_values("score")
+
+    # One trace for all politicians, colored by score, instead of one trace per author
+    fig = go.Figure(
+        go.Bar(
+            x=avg_scores["score"],
+            y=avg_scores["author"],
+            orientation="h",
+            error_x=dict(
+                type="data",
+                symmetric=False,
+                array=avg_scores["ci_high"] - avg_scores["score"],
+                arrayminus=avg_scores["score"] - avg_scores["ci_low"],
+            ),
+            marker=dict(
+                color=avg_scores["score"],
+                colorscale="Viridis",
+                line=dict(color="#000000", width=1),
+                opacity=0.8,
+            ),
+            hoverinfo="x+y",
+            hoverlabel=dict(bgcolor="#ffffff", font_size=16, font_family="Roboto"),
         )
+    )
 
     fig.update_layout(
         title={
@@ -196,28 +232,126 @@ def plot_interactive(df, mode="light"):
         hovermode="y unified",
         template=template,
     )
+    return fig
+
+
+# Every chart of the report, with the aggregates it is drawn from
+CHARTS = {
+    "credibility_by_politician": (plot_credibility_by_politician, lambda cube: cube.totals("author")),
+    "credibility_by_party": (plot_credibility_by_party, lambda cube: cube.totals("party")),
+    "score_distribution": (plot_score_distribution, lambda cube: cube.score_counts("author")),
+    "interactive_by_politician": (plot_interactive, lambda cube: cube.totals("author")),
+}
+
+
+def chart_hash(name, cube):
+    data = CHARTS[name][1](cube).reset_index()
+    digest = hashlib.sha256(name.encode())
+    digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def save_chart(fig, base_path):
+    # PNG, SVG and a standalone HTML page next to each other, named after the chart
+    if isinstance(fig, go.Figure):
+        fig.write_html(base_path.with_suffix(".html"), include_plotlyjs=True)
+        if PLOTLY_STATIC_EXPORT:
+            fig.write_image(base_path.with_suffix(".png"))
+            fig.write_image(base_path.with_suffix(".svg"))
+        return
+    fig.savefig(base_path.with_suffix(".png"), dpi=150)
+    fig.savefig(base_path.with_suffix(".svg"))
+    svg = base_path.with_suffix(".svg").read_text(encoding="utf-8")
+    base_path.with_suffix(".html").write_text(
+        f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{base_path.stem}</title></head>"
+        f"<body>{svg[svg.index('<svg'):]}</body></html>",
+        encoding="utf-8",
+    )
+    plt.close(fig)
 
-    fig.show()
 
+def render_chart(name, cells, report_dir):
+    # Runs in a worker process, so the non-interactive backend can't clash with a GUI
+    start_time = time.perf_counter()
+    plt.switch_backend("Agg")
+    fig = CHARTS[name][0](CredibilityCube(cells))
+    save_chart(fig, Path(report_dir) / name)
+    return name, time.perf_counter() - start_time
 
-def main():
-    df = load_dataset(get_datasets_dir("processed_fact_checking_with_scores.parquet"))
+
+def render_report(cube, report_dir=None, force=False, max_workers=REPORT_WORKERS):
+    """
+    Render every chart to PNG, SVG and HTML files across a process pool.
+
+    Charts whose aggregates hash to the same value as in the previous report are skipped.
+
+    :param cube: CredibilityCube with the aggregates to plot
+    :param report_dir: Output directory, reports/ under the project root by default
+    :param force: Render every chart even if its aggregates haven't changed
+    :param max_workers: Number of worker processes
+    :return: Dictionary from chart name to rendering time in seconds
+    """
+    report_dir = Path(report_dir or get_reports_dir())
+    report_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = report_dir / REPORT_MANIFEST
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+
+    hashes = {name: chart_hash(name, cube) for name in CHARTS}
+    stale = [
+        name for name in CHARTS
+        if force or manifest.get(name) != hashes[name] or not (report_dir / name).with_suffix(".html").exists()
+    ]
+    for name in CHARTS:
+        if name not in stale:
+            print(f"{name}: unchanged, skipped")
+
+    timings = {}
+    if stale:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(stale))) as executor:
+            futures = [executor.submit(render_chart, name, cube.cells, report_dir) for name in stale]
+            for future in futures:
+                name, elapsed = future.result()
+                timings[name] = elapsed
+                manifest[name] = hashes[name]
+                print(f"{name}: rendered in {elapsed:.2f}s")
+        manifest_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+        if not PLOTLY_STATIC_EXPORT:
+            print("kaleido is not installed, interactive charts were only saved as HTML")
+    return timings
+
+
+def main(report_dir=None, force=False):
+    # Aggregates precomputed by processing.py, sliceable by date range and orientation
+    cube = CredibilityCube.load()
+
+    if report_dir is not None:
+        render_report(cube, report_dir, force=force)
+        return
 
     # Find the politician with the lowest average credibility score
-    find_lowest_avg_score_by_politician(df)
+    find_lowest_avg_score_by_politician(cube)
 
     # Plot the average credibility scores for politicians
-    plot_credibility_by_politician(df)
+    plot_credibility_by_politician(cube)
+    plt.show()
 
     # Find the party with the highest average credibility score
-    find_highest_avg_score_by_party(df)
+    find_highest_avg_score_by_party(cube)
 
     # Plot the average credibility scores for parties
-    plot_credibility_by_party(df)
+    plot_credibility_by_party(cube)
+    plt.show()
 
     # Plot interactive average scores
-    plot_interactive(df)
+    plot_interactive(cube).show()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Analyze the credibility scores.")
+    parser.add_argument(
+        "--report", nargs="?", const=get_reports_dir(), default=None, metavar="DIR",
+        help="render every chart to PNG, SVG and HTML files instead of showing them",
+    )
+    parser.add_argument("--force", action="store_true", help="render charts even if their data hasn't changed")
+    args = parser.parse_args()
+    main(report_dir=args.report, force=args.force)
@@ -0,0 +1,331 @@
+import argparse
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from flask import Flask, abort, jsonify, request
+
+from scripts.credibility_cube import CredibilityCube, build_cube
+from scripts.credibility_scoring import rank_credibility
+from scripts.dataset_operators import read_dataset
+from scripts.path_operators import get_datasets_dir
+from scripts.schemas import read_processed_dataset
+from scripts.search_index import MANIFEST_FILE, SEARCH_INDEX_DIR, SearchIndex
+from scripts.storage import to_serializable_frame
+
+PROCESSED_FILE = "processed_fact_checking_with_scores.parquet"
+AUTHOR_FILE = "average_by_author.parquet"
+PARTY_FILE = "average_by_party.parquet"
+RELOAD_INTERVAL = 5
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+def to_records(df):
+    # JSON-ready dicts, with dates as ISO strings instead of Flask's RFC 822 format
+    df = df.copy()
+    for column in df.select_dtypes(include="datetime").columns:
+        df[column] = df[column].dt.strftime("%Y-%m-%d")
+    return to_serializable_frame(df).to_dict("records")
+
+
+def build_ranges(codes):
+    """
+    Group row positions by a categorical column.
+
+    :param codes: Array with the category code of every row
+    :return: Tuple (order, ranges); the rows of code c are order[ranges[c]:ranges[c + 1]]
+    """
+    # A stable sort keeps the newest-first order of the cards within each group
+    order = np.argsort(codes, kind="stable")
+    ranges = np.searchsorted(codes[order], np.arange(codes.max() + 2 if len(codes) else 1))
+    return order, ranges
+
+
+def date_keys(dates):
+    """
+    Sort keys that put the newest dates first.
+
+    :param dates: datetime64[ns] array
+    :return: int64 array, ascending from the newest date, with missing dates last
+    """
+    keys = -dates.astype("int64")
+    keys[np.isnat(dates)] = np.iinfo(np.int64).max
+    return keys
+
+
+class QueryIndex:
+    """
+    In-memory indexes over one snapshot of the processed datasets.
+
+    Cards are serialized once at build time, so a query is a few array lookups plus
+    slicing a list of ready-made dicts. A snapshot is never modified after it is built.
+    """
+
+    def __init__(self, df, df_author, df_party, search_index=None):
+        self.records = to_records(df)
+        self.search_index = search_index
+        self.positions_by_id = {record["id"]: position for position, record in enumerate(self.records)}
+        self.dates = df["date"].to_numpy(dtype="datetime64[ns]")
+        # A stable sort on descending keys keeps the card order among cards of the same date
+        keys = date_keys(self.dates)
+        self.date_order = np.argsort(keys, kind="stable")
+        self.sorted_keys = keys[self.date_order]
+        self.dated_count = int(np.count_nonzero(~np.isnat(self.dates)))
+
+        self.codes, self.order, self.ranges, self.categories = {}, {}, {}, {}
+        for column in ["author", "party"]:
+            values = df[column].cat
+            self.codes[column] = values.codes.to_numpy()
+            self.order[column], self.ranges[column] = build_ranges(self.codes[column])
+            self.categories[column] = {name: code for code, name in enumerate(values.categories)}
+
+        cube = CredibilityCube(build_cube(df))
+        self.summaries = {
+            "author": self.summary_lookup(df_author, rank_credibility(cube.totals("author")), "author"),
+            "party": self.summary_lookup(df_party, rank_credibility(cube.totals("party")), "party"),
+        }
+        # Groups without any processed card have no score to be ranked by
+        self.leaderboards = {
+            column: sorted(
+                (summary for summary in summaries.values() if summary["shrunk_score"] is not None),
+                key=lambda summary: summary["shrunk_score"],
+                reverse=True,
+            )
+            for column, summaries in self.summaries.items()
+        }
+
+    @staticmethod
+    def summary_lookup(df_group, ranking, column):
+        ranking = ranking.astype({column: str})[[column, "shrunk_score", "ci_low", "ci_high"]]
+        df_group = df_group.merge(ranking, on=column, how="left")
+        return {record[column]: record for record in to_records(df_group)}
+
+    @classmethod
+    def load(cls, processed_path=None, author_path=None, party_path=None, search_path=None):
+        return cls(
+            read_processed_dataset(processed_path or get_datasets_dir(PROCESSED_FILE)),
+            read_dataset(author_path or get_datasets_dir(AUTHOR_FILE)),
+            read_dataset(party_path or get_datasets_dir(PARTY_FILE)),
+            SearchIndex(search_path or get_datasets_dir(SEARCH_INDEX_DIR)),
+        )
+
+    def positions(self, column, value):
+        code = self.categories[column].get(value)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        ranges = self.ranges[column]
+        return self.order[column][ranges[code]:ranges[code + 1]]
+
+    def claims(self, author=None, party=None, start=None, end=None, limit=DEFAULT_LIMIT, offset=0):
+        """
+        Cards matching every given filter, newest first.
+
+        :param author: Exact author name
+        :param party: Exact party name
+        :param start: First date to include, numpy datetime64
+        :param end: Last date to include, numpy datetime64
+        :param limit: Maximum number of cards returned
+        :param offset: Number of matching cards to skip
+        :return: Tuple (total, cards) with the number of matches and the requested page
+        """
+        if author is not None or party is not None:
+            # Start from the narrowest index and check the other filters on those rows only
+            column, value = ("author", author) if author is not None else ("party", party)
+            positions = self.positions(column, value)
+            if author is not None and party is not None:
+                positions = positions[self.codes["party"][positions] == self.categories["party"].get(party, -1)]
+            if start is not None:
+                positions = positions[self.dates[positions] >= start]
+            if end is not None:
+                positions = positions[self.dates[positions] <= end]
+        else:
+            # Cards without a date only match when no bound is given
+            low = 0 if end is None else np.searchsorted(self.sorted_keys, -end.astype("int64"), side="left")
+            if start is not None:
+                high = np.searchsorted(self.sorted_keys, -start.astype("int64"), side="right")
+            else:
+                high = len(self.sorted_keys) if end is None else self.dated_count
+            positions = self.date_order[low:high]
+        page = positions[offset:offset + limit]
+        return len(positions), [self.records[position] for position in page]
+
+    def search(self, query, k=DEFAULT_LIMIT):
+        # Cards indexed but not in this snapshot yet are skipped until the next reload
+        if self.search_index is None:
+            return []
+        return [
+            {**self.records[self.positions_by_id[card_id]], "relevance": relevance}
+            for card_id, relevance in self.search_index.search(query, k)
+            if card_id in self.positions_by_id
+        ]
+
+
+class ReloadingIndex:
+    """
+    QueryIndex that is rebuilt in a background thread when the Parquet files change.
+
+    The new snapshot is built aside and swapped in with a single assignment, so requests
+    in flight keep the snapshot they started with and none of them is dropped or blocked.
+    """
+
+    def __init__(self, paths, interval=RELOAD_INTERVAL):
+        self.paths = paths
+        self.interval = interval
+        self.signature = self.current_signature()
+        self.index = QueryIndex.load(*paths)
+        self.loaded_at = time.time()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.watch, daemon=True)
+
+    def current_signature(self):
+        # An index directory changes when its manifest is replaced, or when any file does for older indexes
+        signature = []
+        for path in self.paths:
+            if path.is_dir():
+                manifest = path / MANIFEST_FILE
+                files = [manifest] if manifest.exists() else sorted(file for file in path.rglob("*") if file.is_file())
+            else:
+                files = [path]
+            for file in files:
+                try:
+                    stat = file.stat()
+                except FileNotFoundError:
+                    # Removed while listing, like a segment retired by a compaction
+                    continue
+                signature.append((str(file), stat.st_ino, stat.st_mtime_ns, stat.st_size))
+        return signature
+
+    def reload_if_changed(self):
+        signature = self.current_signature()
+        if signature == self.signature:
+            return False
+        try:
+            index = QueryIndex.load(*self.paths)
+        except Exception as e:
+            # The old snapshot keeps serving, the next write to the files triggers a new attempt
+            self.signature = signature
+            print(f"Reload failed, keeping the previous data: {e}")
+            return False
+        self.index, self.signature, self.loaded_at = index, signature, time.time()
+        print(f"Reloaded {len(index.records)} cards")
+        return True
+
+    def watch(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.reload_if_changed()
+            except OSError as e:
+                # Files replaced while they were listed, the next check sees them settled
+                print(f"Reload check failed, retrying: {e}")
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+def parse_date(name):
+    value = request.args.get(name)
+    # An empty parameter, as sent by a blank form field, is no filter
+    if not value:
+        return None
+    try:
+        date = pd.Timestamp(value)
+    except (TypeError, ValueError):
+        date = pd.NaT
+    if pd.isna(date):
+        abort(400, f"Invalid {name} date: {value}")
+    return np.datetime64(date, "ns")
+
+
+def parse_page():
+    try:
+        limit = min(int(request.args.get("limit", DEFAULT_LIMIT)), MAX_LIMIT)
+        offset = max(int(request.args.get("offset", 0)), 0)
+    except ValueError:
+        abort(400, "limit and offset must be integers")
+    return max(limit, 0), offset
+
+
+def create_app(data_dir=None, reload_interval=RELOAD_INTERVAL):
+    """
+    Build the read-only query API.
+
+    :param data_dir: Directory with the processed and average Parquet files, datasets/ by default
+    :param reload_interval: Seconds between checks for changed files, 0 disables hot reload
+    :return: Flask application
+    """
+    paths = [
+        Path(data_dir) / name if data_dir else get_datasets_dir(name)
+        for name in [PROCESSED_FILE, AUTHOR_FILE, PARTY_FILE, SEARCH_INDEX_DIR]
+    ]
+    snapshot = ReloadingIndex(paths, reload_interval)
+    if reload_interval:
+        snapshot.start()
+
+    app = Flask(__name__)
+    app.json.sort_keys = False
+    app.config["SNAPSHOT"] = snapshot
+
+    @app.get("/health")
+    def health():
+        return jsonify(cards=len(snapshot.index.records), loaded_at=snapshot.loaded_at)
+
+    @app.get("/claims")
+    def claims():
+        limit, offset = parse_page()
+        total, cards = snapshot.index.claims(
+            author=request.args.get("author"),
+            party=request.args.get("party"),
+            start=parse_date("start"),
+            end=parse_date("end"),
+            limit=limit,
+            offset=offset,
+        )
+        return jsonify(total=total, offset=offset, claims=cards)
+
+    @app.get("/search")
+    def search():
+        query = request.args.get("q", "")
+        limit, _ = parse_page()
+        return jsonify(query=query, claims=snapshot.index.search(query, limit))
+
+    @app.get("/politicians/<author>")
+    def politician(author):
+        summary = snapshot.index.summaries["author"].get(author)
+        if summary is None:
+            abort(404, f"Unknown politician: {author}")
+        return jsonify(summary)
+
+    @app.get("/parties/<party>")
+    def party(party):
+        summary = snapshot.index.summaries["party"].get(party)
+        if summary is None:
+            abort(404, f"Unknown party: {party}")
+        return jsonify(summary)
+
+    @app.get("/leaderboard/<kind>")
+    def leaderboard(kind):
+        column = {"politicians": "author", "parties": "party"}.get(kind)
+        if column is None:
+            abort(404, "Leaderboards are available for politicians and parties")
+        limit, offset = parse_page()
+        ranking = snapshot.index.leaderboards[column]
+        if request.args.get("order") == "asc":
+            ranking = ranking[::-1]
+        return jsonify(total=len(ranking), offset=offset, leaderboard=ranking[offset:offset + limit])
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the processed fact-checking data.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+    create_app().run(host=args.host, port=args.port)
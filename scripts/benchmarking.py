@@ -0,0 +1,980 @@
+import argparse
+import asyncio
+import copy
+import itertools
+import json
+import re
+import tempfile
+import threading
+import time
+import warnings
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from difflib import SequenceMatcher
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Pool
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+import numpy as np
+import pandas as pd
+import requests
+import spacy
+from bs4 import BeautifulSoup
+
+from scripts.api import create_app
+from scripts.claim_matching import SentenceIndex, split_sentences
+from scripts.credibility_scoring import SCORE_VALUES, estimate_prior, rank_credibility
+from scripts.dataset_operators import RAW_DATASET, read_dataset
+from scripts.evidence_fetcher import FETCH_WORKERS, SOURCES, EvidenceFetcher
+from scripts.http_operators import REQUEST_TIMEOUT, create_http_session
+from scripts.image_cache import ImageCache
+from scripts.path_operators import get_datasets_dir, get_fixtures_dir
+from scripts.processing import (
+    DATE_FORMATS,
+    MONTHS_IT,
+    NEGATIVE_KEYWORDS,
+    NEUTRAL_KEYWORDS,
+    POSITIVE_KEYWORDS,
+    classify_verdicts,
+    load_dataset,
+    rebuild_all,
+    resolve_images,
+    save_dataset,
+    standardize_dates,
+    verify_incremental,
+)
+from scripts.rate_limiter import RateLimiter
+from scripts.response_cache import ResponseCache
+from scripts.schemas import PROCESSED_SCHEMA, read_processed_dataset
+from scripts.scraping import (
+    BASE_URL,
+    HTML_PARSER,
+    extract_article_verdict,
+    extract_fact_checking_cards_with_verdict,
+    fetch_verdicts_from_articles,
+    find_verdict,
+    find_verdicts_parallel,
+    load_all_cards,
+    open_fact_checking_page,
+    setup_driver,
+)
+from scripts.search_index import MAX_SEGMENTS, SearchIndex, card_texts, update_search_index
+from scripts.storage import iter_documents
+
+CARD_TEMPLATE = (
+    '<li class="col-span-4 flex"><article class="card">'
+    '<h3 class="declaration">«Dichiarazione numero {i}»</h3>'
+    '<div class="declaration-date">{day} maggio 2024</div>'
+    '<div class="declaration-fonte">Fonte: Rai 3</div>'
+    '<a class="btn" href="/fact-checking/dichiarazione-{i}">Leggi</a>'
+    '<h4 class="declaration-author">Politico {author}</h4>'
+    '<p class="declaration-date">Lega</p>'
+    '<button class="pt-8"><div>Vai al verdetto</div></button>'
+    '</article></li>'
+)
+
+VERDICT_TEMPLATES = [
+    "La dichiarazione è {kw} secondo i dati ufficiali.",
+    "Il leader del partito {kw} sui numeri citati.",
+    "I dati disponibili {kw} quanto sostenuto.",
+    "Nessuna delle fonti consultate conferma la cifra.",
+]
+
+
+def time_call(func, *args, **kwargs):
+    start_time = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start_time
+
+
+def make_verdict_corpus(n_rows, seed=42):
+    rng = np.random.default_rng(seed)
+    keywords = NEGATIVE_KEYWORDS + NEUTRAL_KEYWORDS + POSITIVE_KEYWORDS + ["ha detto"]
+    templates = rng.choice(VERDICT_TEMPLATES, size=n_rows)
+    picked = rng.choice(keywords, size=n_rows)
+    return pd.Series([t.format(kw=kw) for t, kw in zip(templates, picked)])
+
+
+def legacy_classify_verdict(verdict):
+    # Per-keyword implementation that processing.classify_verdict used before the compiled patterns
+    verdict = verdict.lower()
+    if any(re.search(rf"\b{kw}\b", verdict) for kw in NEGATIVE_KEYWORDS):
+        return -1
+    elif any(re.search(rf"\b{kw}\b", verdict) for kw in NEUTRAL_KEYWORDS):
+        return 0
+    elif any(re.search(rf"\b{kw}\b", verdict) for kw in POSITIVE_KEYWORDS):
+        return 1
+    return 0
+
+
+def benchmark_classify_verdict(n_rows=1_000_000):
+    verdicts = make_verdict_corpus(n_rows)
+    legacy, legacy_time = time_call(verdicts.apply, legacy_classify_verdict)
+    vectorized, vectorized_time = time_call(classify_verdicts, verdicts)
+    assert legacy.equals(vectorized), "Vectorized classifier diverges from the legacy one"
+    print(
+        f"classify_verdict on {n_rows} rows: legacy {legacy_time:.2f}s, "
+        f"vectorized {vectorized_time:.2f}s ({legacy_time / vectorized_time:.1f}x)"
+    )
+
+
+def make_date_corpus(n_rows, seed=42):
+    rng = np.random.default_rng(seed)
+    days = pd.date_range("2018-01-01", "2024-12-31", freq="D")
+    months = list(MONTHS_IT)[:12]
+    picked = days[rng.integers(0, len(days), size=n_rows)]
+    dates = [f"{day.day} {months[day.month - 1]} {day.year}" for day in picked]
+    # Sprinkle partial and missing dates so every format family is exercised
+    dates[::97] = [f"{months[i % 12]} 2023" for i in range(len(dates[::97]))]
+    dates[::101] = [""] * len(dates[::101])
+    return pd.Series(dates)
+
+
+def legacy_standardize_date(date_str):
+    # Row-wise implementation that processing.standardize_dates replaced
+    if pd.isna(date_str) or date_str.strip() == "":
+        return "1900-01-01"
+    for it_month, en_month in MONTHS_IT.items():
+        date_str = date_str.replace(it_month, en_month)
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(date_str, date_format).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    return "1900-01-01"
+
+
+def benchmark_standardize_dates(n_rows=1_000_000):
+    dates = make_date_corpus(n_rows)
+    legacy, legacy_time = time_call(lambda: pd.to_datetime(dates.apply(legacy_standardize_date)))
+    batched, batched_time = time_call(standardize_dates, dates)
+    assert legacy.equals(batched), "Batched date parser diverges from the legacy one"
+    print(
+        f"standardize_date on {n_rows} rows: legacy {legacy_time:.2f}s, "
+        f"batched {batched_time:.2f}s ({legacy_time / batched_time:.1f}x)"
+    )
+
+
+def make_grouped_frame(n_rows, seed=42):
+    rng = np.random.default_rng(seed)
+    sources = np.array(["Facebook", "X", "Rai 3", "La7", "Corriere della Sera"], dtype=object)
+    average_score = rng.uniform(-1, 1, size=n_rows)
+    average_score[::13] = np.nan
+    return pd.DataFrame({
+        "author": [f"Politico Numero {i}" for i in range(n_rows)],
+        "party": rng.choice(["Lega", "Azione", "Partito Democratico"], size=n_rows),
+        "average_score": average_score,
+        "count": rng.integers(1, 50, size=n_rows),
+        "first_date": pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 1000, size=n_rows), unit="D"),
+        "sources": [sources[: 1 + i % len(sources)] for i in range(n_rows)],
+    })
+
+
+def legacy_iter_documents(df_instance, id_column):
+    # iterrows + per-cell conversion path that storage.iter_documents replaced
+    for index, row in df_instance.iterrows():
+        data = row.to_dict()
+        for key, value in data.items():
+            if isinstance(value, np.ndarray):
+                data[key] = value.tolist()
+            elif pd.isna(value):
+                data[key] = None
+        yield row[id_column].replace(" ", "_").lower(), data
+
+
+def benchmark_iter_documents(n_rows=100_000):
+    df = make_grouped_frame(n_rows)
+    legacy, legacy_time = time_call(lambda: list(legacy_iter_documents(df, "author")))
+    columnar, columnar_time = time_call(lambda: list(iter_documents(df, "author", normalize_ids=True)))
+    assert legacy == columnar, "Columnar conversion diverges from the legacy one"
+    print(
+        f"document conversion on {n_rows} rows: legacy {legacy_time:.2f}s, "
+        f"columnar {columnar_time:.2f}s ({legacy_time / columnar_time:.1f}x)"
+    )
+
+
+def make_card_pages(n_cards, page_size):
+    cards = [CARD_TEMPLATE.format(i=i, day=1 + i % 28, author=i % 90) for i in range(n_cards)]
+    return [cards[start:start + page_size] for start in range(0, n_cards, page_size)]
+
+
+def legacy_load_cards(pages):
+    # Re-parse the whole page after every "load more", as scraping.load_all_cards used to
+    all_cards, seen_titles, loaded = [], set(), []
+    for page in pages:
+        loaded += page
+        soup = BeautifulSoup(f"<ul>{''.join(loaded)}</ul>", "html.parser")
+        for card in extract_fact_checking_cards_with_verdict(soup):
+            if card["title"] not in seen_titles:
+                all_cards.append(card)
+                seen_titles.add(card["title"])
+    return all_cards
+
+
+def incremental_load_cards(pages):
+    # Parse only the fragment appended by each "load more"
+    all_cards, seen_ids = [], set()
+    for page in pages:
+        soup = BeautifulSoup("".join(page), HTML_PARSER)
+        for card in extract_fact_checking_cards_with_verdict(soup):
+            if card["id"] not in seen_ids:
+                all_cards.append(card)
+                seen_ids.add(card["id"])
+    return all_cards
+
+
+def benchmark_load_all_cards(n_cards=5_000, page_size=250):
+    pages = make_card_pages(n_cards, page_size)
+    legacy, legacy_time = time_call(legacy_load_cards, pages)
+    incremental, incremental_time = time_call(incremental_load_cards, pages)
+    assert legacy == incremental, "Incremental card loading diverges from the legacy one"
+    print(
+        f"load_all_cards on {n_cards} cards ({len(pages)} pages, {HTML_PARSER}): legacy {legacy_time:.2f}s, "
+        f"incremental {incremental_time:.2f}s ({legacy_time / incremental_time:.1f}x)"
+    )
+
+
+def make_processed_frame(n_rows, seed=42):
+    # Resample the real processed rows, with fresh ids, up to the requested size
+    df = pd.read_parquet(get_datasets_dir("processed_fact_checking_with_scores.parquet"))
+    df = df.sample(n=n_rows, replace=True, random_state=seed).reset_index(drop=True)
+    df["id"] = [f"{i:032x}" for i in range(n_rows)]
+    df["date"] = pd.to_datetime(df["date"])
+    if "entities" not in df:
+        # Processed files written before the entities column get empty entity lists
+        df["entities"] = [[] for _ in range(n_rows)]
+    return df
+
+
+def benchmark_processed_schema(n_rows=500_000):
+    df = make_processed_frame(n_rows)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        legacy_path = Path(tmp_dir) / "legacy.parquet"
+        canonical_path = Path(tmp_dir) / "canonical.parquet"
+        legacy_df = df.assign(date=df["date"].dt.strftime("%Y-%m-%d"), score=df["score"].astype("int64"))
+        legacy_df.to_parquet(legacy_path, index=False, engine="pyarrow")
+        save_dataset(df, canonical_path, schema=PROCESSED_SCHEMA)
+
+        legacy, legacy_time = time_call(pd.read_parquet, legacy_path)
+        canonical, canonical_time = time_call(read_processed_dataset, canonical_path)
+        legacy_size = legacy_path.stat().st_size
+        canonical_size = canonical_path.stat().st_size
+
+    legacy_memory = legacy.memory_usage(deep=True).sum() / 2**20
+    canonical_memory = canonical.memory_usage(deep=True).sum() / 2**20
+    print(f"processed schema on {n_rows} rows:")
+    print(f"  memory    legacy {legacy_memory:.1f} MiB, canonical {canonical_memory:.1f} MiB")
+    print(f"  load time legacy {legacy_time:.2f}s, canonical {canonical_time:.2f}s")
+    print(f"  file size legacy {legacy_size / 2**20:.1f} MiB, canonical {canonical_size / 2**20:.1f} MiB")
+
+
+def make_score_totals(n_groups, seed=42):
+    rng = np.random.default_rng(seed)
+    counts = rng.integers(1, 200, size=n_groups)
+    score_counts = rng.multinomial(counts, [0.4, 0.3, 0.3])
+    return pd.DataFrame({
+        "score_sum": score_counts @ SCORE_VALUES,
+        "count": counts,
+        "score_sq_sum": score_counts[:, 0] + score_counts[:, 2],
+    }, index=pd.Index([f"Politico {i}" for i in range(n_groups)], name="author"))
+
+
+def loop_bootstrap_intervals(totals, n_samples=2000, seed=42):
+    # One group and one resample at a time, the straightforward alternative to the batched draws
+    prior_mean, prior_strength = estimate_prior(totals)
+    rng = np.random.default_rng(seed)
+    intervals = []
+    for score_sum, count, score_sq_sum in totals[["score_sum", "count", "score_sq_sum"]].itertuples(index=False):
+        scores = np.repeat(SCORE_VALUES, [(score_sq_sum - score_sum) // 2, count - score_sq_sum,
+                                          (score_sq_sum + score_sum) // 2])
+        means = [
+            (rng.choice(scores, size=count).sum() + prior_strength * prior_mean) / (count + prior_strength)
+            for _ in range(n_samples)
+        ]
+        intervals.append(np.quantile(means, [0.025, 0.975]))
+    return intervals
+
+
+def benchmark_rank_credibility(n_groups=500):
+    totals = make_score_totals(n_groups)
+    _, loop_time = time_call(loop_bootstrap_intervals, totals)
+    _, batched_time = time_call(rank_credibility, totals)
+    print(
+        f"bootstrap intervals for {n_groups} groups: loop {loop_time:.2f}s, "
+        f"batched {batched_time:.2f}s ({loop_time / batched_time:.1f}x)"
+    )
+
+
+def benchmark_api_latency(n_requests=5_000, seed=42):
+    # In-process requests through the Flask test client, so only the app itself is timed
+    client = create_app(reload_interval=0).test_client()
+    index = client.application.config["SNAPSHOT"].index
+    authors = list(index.summaries["author"])
+    parties = list(index.summaries["party"])
+    rng = np.random.default_rng(seed)
+    urls = {
+        "by author": lambda: f"/claims?author={rng.choice(authors)}",
+        "by party": lambda: f"/claims?party={rng.choice(parties)}&start=2023-01-01",
+        "by date": lambda: "/claims?start=2022-01-01&end=2022-12-31",
+        "politician": lambda: f"/politicians/{rng.choice(authors)}",
+        "leaderboard": lambda: "/leaderboard/politicians?limit=20",
+    }
+    latencies = {endpoint: [] for endpoint in urls}
+    for i in range(n_requests):
+        endpoint = list(urls)[i % len(urls)]
+        url = urls[endpoint]()
+        response, elapsed = time_call(client.get, url)
+        assert response.status_code == 200, f"{url} returned {response.status_code}"
+        latencies[endpoint].append(elapsed * 1000)
+    print(f"query API latency over {n_requests} requests:")
+    for endpoint, values in latencies.items():
+        p50, p99 = np.percentile(values, [50, 99])
+        print(f"  {endpoint:<12} p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+
+
+def make_search_corpus(n_cards, words_per_card=40, seed=42):
+    # Cards drawn word by word from the real word frequencies, so posting lists have realistic lengths
+    df = read_processed_dataset(get_datasets_dir("processed_fact_checking_with_scores.parquet"))
+    words = pd.Series(" ".join(card_texts(df)).split()).value_counts()
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(words.index.to_numpy(), size=(n_cards, words_per_card), p=words / words.sum())
+    texts = [" ".join(row) for row in picked]
+    queries = [" ".join(title.split()[:4]) for title in df["title"].astype(str).sample(200, random_state=seed)]
+    return [f"{i:032x}" for i in range(n_cards)], texts, queries
+
+
+def benchmark_search_index(n_cards=1_000_000, k=10):
+    ids, texts, queries = make_search_corpus(n_cards)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "search_index"
+        # Built in two batches, so the query also merges statistics across segments
+        half = n_cards // 2
+        _, build_time = time_call(lambda: update_search_index(pd.DataFrame({
+            "id": ids[:half], "title": texts[:half], "verdict": ""}), path=path))
+        update_search_index(pd.DataFrame({"id": ids[half:], "title": texts[half:], "verdict": ""}), path=path)
+        index = SearchIndex(path)
+        latencies = [time_call(index.search, query, k)[1] * 1000 for query in queries]
+    p50, p99 = np.percentile(latencies, [50, 99])
+    print(
+        f"search index on {n_cards} cards: build of {half} cards {build_time:.1f}s, "
+        f"top-{k} query p50 {p50:.2f} ms, p99 {p99:.2f} ms"
+    )
+
+
+def check_search_index_compaction(n_batches=40, batch_size=50):
+    # Readers opening the index while batches are added and merged must see every card exactly once
+    ids, texts, _ = make_search_corpus(n_batches * batch_size)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "search_index"
+        index = SearchIndex(path)
+        index.add(ids[:batch_size], texts[:batch_size])
+        done, opened, errors = threading.Event(), [], []
+
+        def read():
+            while not done.is_set():
+                try:
+                    reader = SearchIndex(path)
+                    indexed = reader.indexed_ids()
+                    assert len(indexed) == len(np.unique(indexed)), f"{len(indexed)} ids, duplicates included"
+                    opened.append(len(indexed))
+                except Exception as e:
+                    errors.append(e)
+
+        reader_thread = threading.Thread(target=read)
+        reader_thread.start()
+        for start in range(batch_size, n_batches * batch_size, batch_size):
+            index.add(ids[start:start + batch_size], texts[start:start + batch_size])
+        done.set()
+        reader_thread.join()
+        segment_dirs = list(path.glob("segment-*"))
+    assert not errors, errors[:3]
+    assert len(index) == n_batches * batch_size
+    print(
+        f"search index: {n_batches} batches added with {n_batches // (MAX_SEGMENTS + 1)} compactions, "
+        f"{len(opened)} concurrent opens without a duplicate card, {len(segment_dirs)} segments left"
+    )
+
+
+MATCHING_CLAIM = "giorgia meloni said unemployment rome fell 7 percent 2023"
+MATCHING_ENTITIES = ["giorgia meloni", "rome"]
+# Sentences that report the claim, verbatim or reworded, planted in the corpus
+CLAIM_VARIANTS = [
+    "Giorgia Meloni said unemployment in Rome fell to 7 percent in 2023.",
+    "Giorgia Meloni said unemployment in Rome fell to 8 percent in 2023.",
+    "In 2023 unemployment in Rome fell to 7 percent, Giorgia Meloni said.",
+    "According to Istat, Giorgia Meloni said that unemployment in Rome fell to 7 percent in 2023 after the reforms.",
+]
+
+
+def make_matching_corpus(n_bytes=1_000_000, seed=42):
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("abcdefghilmnoprstuv"))
+    words = ["".join(rng.choice(letters, size=rng.integers(3, 10))) for _ in range(3000)]
+    words += ["unemployment", "percent", "said", "fell", "rose", "budget", "rome", "giorgia", "meloni"]
+    sentences, planted, size = [], [], 0
+    while size < n_bytes:
+        if rng.random() < 0.002:
+            sentence = CLAIM_VARIANTS[len(planted) % len(CLAIM_VARIANTS)]
+            planted.append(len(sentences))
+        else:
+            sentence = " ".join(rng.choice(words, size=rng.integers(8, 20))).capitalize() + "."
+            if rng.random() < 0.1:
+                # Entity mentions without the claim, the candidates the prefilter has to keep
+                sentence = f"{MATCHING_ENTITIES[len(sentences) % 2].title()} {sentence}"
+        sentences.append(sentence)
+        size += len(sentence) + 1
+    # A line break every few sentences, like paragraphs of page and news text
+    text = "".join(s + ("\n" if i % 5 == 4 else " ") for i, s in enumerate(sentences))
+    return text, {sentences[i].lower() for i in planted}
+
+
+def legacy_find_matches(nlp, claim, entities, text):
+    # Full spaCy pass over the corpus plus SequenceMatcher per sentence and entity, as ClaimAnalyzer did
+    nlp.max_length = max(nlp.max_length, len(text) + 1)
+    matches = []
+    for sent in nlp(text.lower()).sents:
+        for entity in entities:
+            if entity in sent.text and SequenceMatcher(None, claim, sent.text).ratio() > 0.7:
+                matches.append(sent.text.strip())
+    return matches
+
+
+def benchmark_find_matches(n_bytes=1_000_000):
+    text, planted = make_matching_corpus(n_bytes)
+    try:
+        nlp, pipeline = spacy.load("en_core_web_sm"), "en_core_web_sm"
+    except OSError:
+        # Without the model the legacy side only pays for a sentencizer, which understates its cost
+        nlp, pipeline = spacy.blank("en"), "blank sentencizer"
+        nlp.add_pipe("sentencizer")
+    legacy, legacy_time = time_call(legacy_find_matches, nlp, MATCHING_CLAIM, MATCHING_ENTITIES, text)
+    indexed, indexed_time = time_call(
+        lambda: SentenceIndex(split_sentences(text.lower())).find_matches(MATCHING_CLAIM, MATCHING_ENTITIES)
+    )
+    legacy_found, indexed_found = planted & set(legacy), planted & set(indexed)
+    print(
+        f"find_matches on {len(text) / 2**20:.1f} MiB ({pipeline}): legacy {legacy_time:.2f}s, "
+        f"indexed {indexed_time:.2f}s ({legacy_time / indexed_time:.1f}x)"
+    )
+    print(
+        f"  recall of the {len(planted)} planted variants: legacy {len(legacy_found) / len(planted):.0%}, "
+        f"indexed {len(indexed_found) / len(planted):.0%}; false matches: legacy {len(set(legacy) - planted)}, "
+        f"indexed {len(set(indexed) - planted)}"
+    )
+
+
+MOCK_RESPONSES = {
+    "/v1alpha1/claims:search": {"claims": [{"text": "unemployment fell", "claimReview": []}]},
+    "/w/api.php": {
+        "query": {
+            "search": [{"title": "Unemployment in Italy"}],
+            "pages": {"1": {"title": "Unemployment in Italy", "extract": "Unemployment in Italy fell in 2023."}},
+        }
+    },
+    "/v2/everything": {"articles": [{"content": "Unemployment in Rome fell to 7 percent."}]},
+}
+
+
+class LocalServer(ThreadingHTTPServer):
+    # The default backlog of 5 drops simultaneous connections, which then wait a second for a SYN retry
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class MockSourceHandler(BaseHTTPRequestHandler):
+    # Canned answers for the Fact Check Tools, Wikipedia and NewsAPI endpoints, with configurable latency
+    def do_GET(self):
+        path = urlparse(self.path).path
+        self.server.requested.append(path)
+        self.server.delay(path)
+        if path in MOCK_RESPONSES:
+            body, content_type = json.dumps(MOCK_RESPONSES[path]).encode(), "application/json"
+        else:
+            body, content_type = b"<html><body><p>Unemployment in Italy fell in 2023.</p></body></html>", "text/html"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_sources(latencies, slow_every=10, slow_latency=3.0):
+    """
+    Serve the external sources locally, so the fetchers can run offline.
+
+    :param latencies: Seconds each path takes to answer, e.g. {"/v2/everything": 0.3}
+    :param slow_every: Every n-th request to a path takes slow_latency instead, 0 to disable
+    :param slow_latency: Latency of the slow tail in seconds
+    :return: Tuple (server, base_urls) with base_urls as expected by EvidenceFetcher; server.requested lists
+        the requested paths
+    """
+    server = LocalServer(("127.0.0.1", 0), MockSourceHandler)
+    server.requested = []
+    counters = {path: itertools.count(1) for path in MOCK_RESPONSES}
+
+    def delay(path):
+        slow = slow_every and path in counters and next(counters[path]) % slow_every == 0
+        time.sleep(slow_latency if slow else latencies.get(path, 0))
+
+    server.delay = delay
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    return server, {
+        "google_fact_check": f"{base_url}/v1alpha1/claims:search",
+        "wikipedia": f"{base_url}/w/api.php",
+        "newsapi": f"{base_url}/v2/everything",
+    }
+
+
+class StubPageHandler(BaseHTTPRequestHandler):
+    # Serves server.pages, a dictionary from path to (status, body), and records every requested path
+    def do_GET(self):
+        path = unquote(urlparse(self.path).path)
+        self.server.requested.append(path)
+        status, body = self.server.pages.get(path, (404, "<html><body>Pagina non trovata</body></html>"))
+        body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(pages):
+    """
+    Serve canned HTML pages locally.
+
+    :param pages: Dictionary from path to (status, body)
+    :return: Tuple (server, base_url); server.requested lists the paths requested so far
+    """
+    server = LocalServer(("127.0.0.1", 0), StubPageHandler)
+    server.pages = pages
+    server.requested = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def wikipedia_page(body, disambiguation=False):
+    notice = '<div class="avviso-disambigua">Disambigua</div>' if disambiguation else ""
+    return f'<html><body>{notice}<div class="mw-parser-output">{body}</div></body></html>'
+
+
+def infobox(image):
+    return f'<table class="infobox"><tr><td><img src="{image}"></td></tr></table>'
+
+
+WIKIPEDIA_STUB_PAGES = {
+    "/wiki/Mario Rossi": (200, wikipedia_page(infobox("//upload.wikimedia.org/mario_rossi.jpg"))),
+    # Disambiguation pages are resolved to the entry describing an active Italian party
+    "/wiki/Partito del Futuro": (200, wikipedia_page(
+        '<ul><li><a href="/wiki/Partito_del_Futuro_(film)">Partito del Futuro (film)</a>, film del 1999</li>'
+        '<li><a href="/wiki/Partito_del_Futuro_(2019)">Partito del Futuro (2019)</a>, '
+        "partito politico italiano attivo dal 2019</li></ul>",
+        disambiguation=True,
+    )),
+    "/wiki/Partito_del_Futuro_(2019)": (200, wikipedia_page(infobox("//upload.wikimedia.org/logo_pdf.png"))),
+    "/wiki/Giulia Bianchi": (200, wikipedia_page("<p>Voce senza infobox</p>")),
+    "/wiki/Luca Verdi": (500, "<html><body>Errore del server</body></html>"),
+}
+
+
+def check_resolve_images():
+    # Offline check of the image lookups against a stub Wikipedia, including disambiguation and failures
+    server, base_url = start_stub_server(WIKIPEDIA_STUB_PAGES)
+    queries = pd.Series(["Mario Rossi", "Partito del Futuro", "Giulia Bianchi", "Luca Verdi", "Anna Neri",
+                         "Mario Rossi", "Partito Democratico"])
+    expected = {
+        "Mario Rossi": "https://upload.wikimedia.org/mario_rossi.jpg",
+        "Partito del Futuro": "https://upload.wikimedia.org/logo_pdf.png",
+        "Giulia Bianchi": None,
+        "Luca Verdi": None,
+        "Anna Neri": None,
+        "Partito Democratico": "https://upload.wikimedia.org/logo_pd.png",
+    }
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = Path(tmp_dir) / "image_cache.sqlite"
+            pinned = {"Partito Democratico": expected["Partito Democratico"]}
+            image_cache = ImageCache(db_path, pinned=pinned)
+            images = resolve_images(queries, image_cache, base_url=base_url)
+            assert images.tolist() == queries.map(expected).tolist(), images.tolist()
+            # Pinned queries are never requested; the server error is retried by the session
+            assert set(server.requested) == {
+                "/wiki/Mario Rossi", "/wiki/Partito del Futuro", "/wiki/Partito_del_Futuro_(2019)",
+                "/wiki/Giulia Bianchi", "/wiki/Luca Verdi", "/wiki/Anna Neri",
+            }, server.requested
+            assert server.requested.count("/wiki/Mario Rossi") == 1, server.requested
+            # Pages without an image and missing pages are cached, the server error is not
+            assert image_cache.get("Giulia Bianchi") == (True, None)
+            assert image_cache.get("Anna Neri") == (True, None)
+            assert image_cache.get("Luca Verdi") == (False, None)
+            image_cache.close()
+
+            # The next run only retries the failed lookup
+            server.requested.clear()
+            image_cache = ImageCache(db_path, pinned=pinned)
+            images = resolve_images(queries, image_cache, base_url=base_url)
+            assert images.tolist() == queries.map(expected).tolist(), images.tolist()
+            assert set(server.requested) == {"/wiki/Luca Verdi"}, server.requested
+            image_cache.close()
+    finally:
+        server.shutdown()
+    print(f"image lookups on a stub Wikipedia: {len(expected)} queries resolved as expected, only failures retried")
+
+
+def check_incremental_processing(n_old=300):
+    """
+    Check that an incremental update yields the same outputs as a full rebuild.
+
+    The committed raw cards are the fixture: the first n_old are processed by a full build
+    that finds no image, as when Wikipedia is unreachable, and the rest are folded in by an
+    incremental update that finds the images, which must also fill the images missing so far.
+    """
+    df_raw = load_dataset(get_datasets_dir(RAW_DATASET))
+    df_author = read_dataset(get_datasets_dir("average_by_author.parquet"))
+    df_party = read_dataset(get_datasets_dir("average_by_party.parquet"))
+    images = {
+        **dict(zip(df_author["author"], df_author["author_image"])),
+        **dict(zip(df_party["party"], df_party["party_image"])),
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir, warnings.catch_warnings():
+        # Dtype downcasts warned about now become errors in later pandas versions
+        warnings.simplefilter("error", FutureWarning)
+        offline_cache = ImageCache(Path(tmp_dir) / "offline.sqlite", pinned=dict.fromkeys(images))
+        df_processed, df_author, df_party = rebuild_all(df_raw.iloc[:n_old], offline_cache)
+        online_cache = ImageCache(Path(tmp_dir) / "online.sqlite", pinned=images)
+        verify_incremental(df_raw, df_processed, df_author, df_party, online_cache)
+        offline_cache.close()
+        online_cache.close()
+    print(f"incremental update of {len(df_raw)} raw cards on top of the first {n_old} matches a full rebuild")
+
+
+# Verdicts the clicking path reads from fixtures/fact_checking_list.html, in card order. The fixture pages are
+# synthetic, written after the markup the selectors target; check_captured_article_verdicts runs on real pages
+FIXTURE_VERDICTS = [
+    "La percentuale citata dalla ministra è corretta.",
+    "I numeri danno torto al presidente del Movimento 5 Stelle.",
+    "La dichiarazione è fuorviante: il dato riguarda un solo trimestre.",
+    # This card never turns over, so it runs into its time budget
+    "No verdict available",
+    "Il dato è esagerato se si tiene conto dell'inflazione.",
+    "Sostanzialmente corretta, le cifre sono quelle dell'Istat.",
+]
+
+
+def start_fixture_site():
+    # The saved fact-checking pages, served on localhost under the paths of the real site
+    pages = {"/fact-checking": (200, get_fixtures_dir("fact_checking_list.html").read_text())}
+    for article_path in get_fixtures_dir("articles").glob("*.html"):
+        pages[f"/fact-checking/{article_path.stem}"] = (200, article_path.read_text())
+    return start_stub_server(pages)
+
+
+def read_fixture_cards():
+    # Cards behind "load more" sit in a template, whose text BeautifulSoup leaves out of get_text,
+    # so they are parsed as the fragment the browser appends
+    soup = BeautifulSoup(get_fixtures_dir("fact_checking_list.html").read_text(), HTML_PARSER)
+    more_cards = soup.find("template").extract()
+    return [
+        card
+        for markup in (soup, BeautifulSoup(more_cards.decode_contents(), HTML_PARSER))
+        for card in extract_fact_checking_cards_with_verdict(markup)
+    ]
+
+
+def start_fixture_driver(url):
+    # A driver with every fixture card loaded, None where Chrome cannot be started
+    try:
+        driver = setup_driver()
+    except Exception as e:
+        print(f"Chrome could not be started, skipping the Selenium checks: {e!r}")
+        return None
+    open_fact_checking_page(driver, url)
+    return driver
+
+
+def check_find_verdicts_parallel(n_workers=3, time_budget=3):
+    # The driver pool must read the same verdicts as a single driver, and give up on a card within its budget
+    server, base_url = start_fixture_site()
+    url = f"{base_url}/fact-checking"
+    try:
+        driver = start_fixture_driver(url)
+        if driver is None:
+            return
+        cards = load_all_cards(driver, max_cards=len(FIXTURE_VERDICTS))
+        stuck_index = FIXTURE_VERDICTS.index("No verdict available")
+        start_time = time.perf_counter()
+        stuck_card = find_verdict(driver, {**cards[stuck_index], "verdict": ""}, stuck_index, time_budget)
+        stuck_time = time.perf_counter() - start_time
+        driver.quit()
+        assert stuck_card["verdict"] == "No verdict available", stuck_card
+        assert stuck_time <= time_budget + 1, f"card took {stuck_time:.1f}s with a {time_budget}s budget"
+
+        pending = [{**card, "verdict": ""} for card in cards]
+        serial, serial_time = time_call(
+            find_verdicts_parallel, copy.deepcopy(pending), url, len(cards), 1, time_budget
+        )
+        pooled, pooled_time = time_call(
+            find_verdicts_parallel, copy.deepcopy(pending), url, len(cards), n_workers, time_budget
+        )
+    finally:
+        server.shutdown()
+    assert [card["verdict"] for card in serial] == FIXTURE_VERDICTS, serial
+    assert [card["verdict"] for card in pooled] == FIXTURE_VERDICTS, pooled
+    print(
+        f"verdicts of {len(cards)} fixture cards: 1 driver {serial_time:.1f}s, {n_workers} drivers {pooled_time:.1f}s, "
+        f"same verdicts; a card that never turns over gave up after {stuck_time:.1f}s of {time_budget}s"
+    )
+
+
+def check_article_verdicts():
+    # The list markup and the synthetic article pages must agree with the verdicts the clicking path reads
+    cards = read_fixture_cards()
+    assert len(cards) == len(FIXTURE_VERDICTS), cards
+    markup_verdicts = [card["verdict"] for card in cards]
+    for verdict, expected in zip(markup_verdicts, FIXTURE_VERDICTS):
+        assert verdict in ("", expected), (verdict, expected)
+
+    server, base_url = start_fixture_site()
+    try:
+        article_cards = fetch_verdicts_from_articles(
+            [{**card, "verdict": ""} for card in cards], base_url=base_url
+        )
+        driver = start_fixture_driver(f"{base_url}/fact-checking")
+        if driver is not None:
+            try:
+                load_all_cards(driver, max_cards=len(cards))
+                clicked = [
+                    find_verdict(driver, {**card, "verdict": ""}, card_index, 3)["verdict"]
+                    for card_index, card in enumerate(cards)
+                ]
+            finally:
+                driver.quit()
+            assert clicked == FIXTURE_VERDICTS, clicked
+    finally:
+        server.shutdown()
+    # Related cards on the article pages carry other verdicts; the card that never turns over has no verdict box
+    expected = ["" if verdict == "No verdict available" else verdict for verdict in FIXTURE_VERDICTS]
+    article_verdicts = [card["verdict"] for card in article_cards]
+    assert article_verdicts == expected, article_verdicts
+    print(
+        f"verdicts of {len(cards)} fixture cards: {sum(map(bool, markup_verdicts))} in the list markup, "
+        f"{sum(map(bool, article_verdicts))} in the article pages, all matching the clicked verdicts"
+    )
+
+
+def capture_article_pages(n_pages=5):
+    # Saves the article pages of stored cards as the site serves them, for check_captured_article_verdicts
+    df = read_dataset(get_datasets_dir(RAW_DATASET), columns=["read_more_link", "verdict"])
+    links = df.loc[(df["read_more_link"] != "") & (df["verdict"] != "No verdict available"), "read_more_link"]
+    captured_dir = get_fixtures_dir("captured")
+    captured_dir.mkdir(exist_ok=True)
+    with create_http_session() as session:
+        for link in links.head(n_pages):
+            response = session.get(f"{BASE_URL}{link}", timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            (captured_dir / f"{link.rstrip('/').rsplit('/', 1)[-1]}.html").write_bytes(response.content)
+            print(f"captured {link}")
+
+
+def check_captured_article_verdicts():
+    # Real article pages must give the verdicts the clicking path stored for the same cards
+    pages = sorted(get_fixtures_dir("captured").glob("*.html"))
+    if not pages:
+        print("No captured article pages, skipping the check on real markup (run with --capture-articles)")
+        return
+    df = read_dataset(get_datasets_dir(RAW_DATASET), columns=["title", "read_more_link", "verdict"])
+    stored = {link: (title, verdict) for title, link, verdict in zip(df["title"], df["read_more_link"], df["verdict"])}
+    mismatches = []
+    for page in pages:
+        title, verdict = stored[f"/fact-checking/{page.stem}"]
+        found = extract_article_verdict(BeautifulSoup(page.read_bytes(), HTML_PARSER), title)
+        if found != verdict:
+            mismatches.append((page.name, found, verdict))
+    assert not mismatches, mismatches
+    print(f"verdicts of {len(pages)} captured article pages match the clicked verdicts")
+
+
+def legacy_fetch_all(claim, base_urls):
+    # A new thread pool per claim and unpooled requests without timeouts, as DataFetcher used to
+    def wikipedia():
+        search = requests.get(base_urls["wikipedia"], params={"srsearch": claim}).json()
+        title = search["query"]["search"][0]["title"]
+        return requests.get(base_urls["wikipedia"].replace("/w/api.php", f"/wiki/{title}")).text
+
+    with ThreadPoolExecutor() as executor:
+        futures = {
+            "google_fact_check": executor.submit(lambda: requests.get(base_urls["google_fact_check"]).json()),
+            "wikipedia": executor.submit(wikipedia),
+            "newsapi": executor.submit(lambda: requests.get(base_urls["newsapi"]).json()),
+        }
+        return {source: future.result() for source, future in futures.items()}
+
+
+def benchmark_evidence_fetcher(n_claims=20):
+    latencies = {"/v1alpha1/claims:search": 0.05, "/w/api.php": 0.1, "/v2/everything": 0.3}
+    server, base_urls = start_mock_sources(latencies)
+    claims = [f"claim number {i}" for i in range(n_claims)]
+    try:
+        _, legacy_time = time_call(lambda: [legacy_fetch_all(claim, base_urls) for claim in claims])
+        fetcher = EvidenceFetcher(base_urls=base_urls, hedge_delays={"newsapi": 0.6}, deadline=2)
+        results, async_time = time_call(asyncio.run, fetcher.fetch_many(claims))
+        fetcher.close()
+    finally:
+        server.shutdown()
+    complete = sum(all(value is not None for value in result.values()) for result in results)
+    print(
+        f"evidence fetching for {n_claims} claims on local mocks: legacy {legacy_time:.2f}s, "
+        f"async {async_time:.2f}s ({legacy_time / async_time:.1f}x), {complete}/{n_claims} claims with every source"
+    )
+
+
+def check_hedging_fast_sources(n_claims=40, latency=0.7, hedge_delay=1.0, small_pool=6):
+    # Every source answers before its hedge delay, so no request may be hedged, even one queued behind others
+    server, base_urls = start_mock_sources(dict.fromkeys(MOCK_RESPONSES, latency), slow_every=0)
+    claims = [f"claim number {i}" for i in range(n_claims)]
+    try:
+        for max_workers in (FETCH_WORKERS, small_pool):
+            server.requested.clear()
+            fetcher = EvidenceFetcher(
+                base_urls=base_urls, hedge_delays=dict.fromkeys(SOURCES, hedge_delay), max_workers=max_workers
+            )
+            results, elapsed = time_call(asyncio.run, fetcher.fetch_many(claims))
+            fetcher.close()
+            counts = Counter(server.requested)
+            assert all(counts[path] == n_claims for path in MOCK_RESPONSES), counts
+            assert all(value is not None for result in results for value in result.values())
+            print(
+                f"{n_claims} claims with every source answering in {latency}s on {max_workers} workers: "
+                f"{len(server.requested)} requests, none hedged, {elapsed:.1f}s"
+            )
+    finally:
+        server.shutdown()
+
+
+class LegacyRateLimiter:
+    # Sliding window rebuilt on every check, as prototyping.APIRateLimiter used to
+    def __init__(self, max_calls_per_minute):
+        self.max_calls_per_minute = max_calls_per_minute
+        self.call_times = []
+
+    def can_make_call(self):
+        current_time = time.time()
+        self.call_times = [t for t in self.call_times if t > current_time - 60]
+        return len(self.call_times) < self.max_calls_per_minute
+
+    def record_call(self):
+        self.call_times.append(time.time())
+
+
+def drain_shared_budget(db_path, attempts=200):
+    # Calls one worker process gets out of a budget shared with the others
+    limiter = RateLimiter(10, 60, name="google_fact_check", db_path=db_path)
+    return sum(limiter.try_acquire() for _ in range(attempts))
+
+
+def benchmark_rate_limiter(budget=10_000, n_checks=20_000, n_processes=4):
+    legacy = LegacyRateLimiter(budget)
+
+    def legacy_checks():
+        for _ in range(n_checks):
+            if legacy.can_make_call():
+                legacy.record_call()
+
+    limiter = RateLimiter(budget, 60)
+    _, legacy_time = time_call(legacy_checks)
+    _, gcra_time = time_call(lambda: [limiter.try_acquire() for _ in range(n_checks)])
+    print(
+        f"rate limit checks with a budget of {budget}/min: legacy {legacy_time / n_checks * 1e6:.1f}us, "
+        f"GCRA {gcra_time / n_checks * 1e6:.2f}us per check ({legacy_time / gcra_time:.0f}x)"
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = Path(tmp_dir) / "rate_limits.sqlite"
+        RateLimiter(10, 60, name="google_fact_check", db_path=db_path)
+        with Pool(n_processes) as pool:
+            granted = pool.map(drain_shared_budget, [db_path] * n_processes)
+    print(f"shared budget of 10/min across {n_processes} processes: {sum(granted)} calls granted {granted}")
+
+
+def benchmark_response_cache(n_claims=20, repeats=3):
+    latencies = {"/v1alpha1/claims:search": 0.05, "/w/api.php": 0.1, "/v2/everything": 0.3}
+    server, base_urls = start_mock_sources(latencies, slow_every=0)
+    # Every claim is asked several times, as the same statements come up again and again
+    claims = [f"claim number {i % n_claims}" for i in range(n_claims * repeats)]
+    try:
+        fetcher = EvidenceFetcher(base_urls=base_urls)
+        _, uncached_time = time_call(asyncio.run, fetcher.fetch_many(claims))
+        fetcher.close()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = Path(tmp_dir) / "response_cache.sqlite"
+            cache = ResponseCache(db_path)
+            fetcher = EvidenceFetcher(base_urls=base_urls, cache=cache)
+            server.requested.clear()
+            _, cached_time = time_call(asyncio.run, fetcher.fetch_many(claims))
+            fetcher.close()
+            # Concurrent lookups of a claim share one fetch, so every source is asked once per distinct claim
+            assert cache.misses == len(server.requested) == n_claims * len(SOURCES), (cache.stats(), server.requested)
+            print(
+                f"evidence for {len(claims)} lookups of {n_claims} claims: uncached {uncached_time:.2f}s, "
+                f"cached {cached_time:.2f}s, {cache.stats()}"
+            )
+            cache.close()
+
+            # A new run starts with an empty memory tier and is answered from disk
+            cache = ResponseCache(db_path)
+            fetcher = EvidenceFetcher(base_urls=base_urls, cache=cache)
+            _, disk_time = time_call(asyncio.run, fetcher.fetch_many(claims[:n_claims]))
+            fetcher.close()
+            print(f"new run from the disk tier: {disk_time:.3f}s, {cache.stats()}")
+            cache.close()
+
+            cache = ResponseCache(db_path, disk_bytes=1_000)
+            stored = cache.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            print(f"store reopened with a 1000 byte bound: {stored[0]} responses, {stored[1]} bytes kept")
+            cache.close()
+    finally:
+        server.shutdown()
+
+
+def main():
+    check_hedging_fast_sources()
+    check_search_index_compaction()
+    check_resolve_images()
+    check_incremental_processing()
+    check_find_verdicts_parallel()
+    check_article_verdicts()
+    check_captured_article_verdicts()
+    benchmark_classify_verdict()
+    benchmark_standardize_dates()
+    benchmark_iter_documents()
+    benchmark_load_all_cards()
+    benchmark_processed_schema()
+    benchmark_rank_credibility()
+    benchmark_api_latency()
+    benchmark_search_index()
+    benchmark_find_matches()
+    benchmark_evidence_fetcher()
+    benchmark_rate_limiter()
+    benchmark_response_cache()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the offline checks and the benchmarks.")
+    parser.add_argument(
+        "--capture-articles", type=int, metavar="N",
+        help="save the article pages of N stored cards under fixtures/captured/ and exit (needs the network)",
+    )
+    args = parser.parse_args()
+    if args.capture_articles:
+        capture_article_pages(args.capture_articles)
+    else:
+        main()
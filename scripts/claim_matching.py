@@ -0,0 +1,97 @@
+import re
+
+import numpy as np
+
+SIMILARITY_THRESHOLD = 0.5
+WORD_PATTERN = re.compile(r"\w+")
+# A sentence ends at ., ! or ? followed by whitespace, or at a line break
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\s*\n\s*")
+
+
+def split_sentences(text):
+    # Rule-based sentence boundaries in one regex pass: no tokenizer, tagger, parser or NER runs on the corpus
+    return [sentence for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+
+class SentenceIndex:
+    """
+    Inverted index and TF-IDF vectors over the sentences of a corpus.
+
+    Every (sentence, term) pair is stored once with its TF-IDF weight, sorted by term, so
+    the sentences containing a term are a contiguous slice and a cosine similarity is a
+    gather plus a bincount instead of a comparison per sentence.
+    """
+
+    def __init__(self, sentences):
+        self.sentences = list(sentences)
+        self.vocabulary = {}
+        sentence_ids, term_ids = [], []
+        for sentence_id, sentence in enumerate(self.sentences):
+            tokens = WORD_PATTERN.findall(sentence.lower())
+            term_ids.extend(self.vocabulary.setdefault(token, len(self.vocabulary)) for token in tokens)
+            sentence_ids.extend([sentence_id] * len(tokens))
+
+        n_sentences, n_terms = len(self.sentences), max(len(self.vocabulary), 1)
+        keys = np.array(term_ids, dtype=np.int64) * n_sentences + np.array(sentence_ids, dtype=np.int64)
+        keys, counts = np.unique(keys, return_counts=True)
+        self.posting_terms = keys // max(n_sentences, 1)
+        self.posting_sentences = keys % max(n_sentences, 1)
+        self.offsets = np.searchsorted(self.posting_terms, np.arange(n_terms + 1))
+
+        # Smoothed idf, so terms missing from the corpus still get a finite weight in the claim
+        document_frequencies = np.diff(self.offsets)
+        self.idf = np.log((1 + n_sentences) / (1 + document_frequencies)) + 1
+        self.unseen_idf = np.log(1 + n_sentences) + 1
+        self.weights = counts * self.idf[self.posting_terms]
+        self.norms = np.sqrt(np.bincount(self.posting_sentences, self.weights ** 2, minlength=n_sentences))
+
+    def postings(self, term):
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            return slice(0, 0)
+        return slice(self.offsets[term_id], self.offsets[term_id + 1])
+
+    def sentences_with(self, entity):
+        # Sentences containing every word of the entity, e.g. both "giorgia" and "meloni"
+        sentence_sets = [self.posting_sentences[self.postings(token)] for token in WORD_PATTERN.findall(entity.lower())]
+        if not sentence_sets:
+            return np.empty(0, dtype=np.int64)
+        matched = sentence_sets[0]
+        for sentence_set in sentence_sets[1:]:
+            matched = np.intersect1d(matched, sentence_set, assume_unique=True)
+        return matched
+
+    def similarities(self, claim):
+        """
+        TF-IDF cosine similarity between a claim and every sentence.
+
+        :param claim: Claim text
+        :return: Array with one similarity per sentence
+        """
+        terms, counts = np.unique(WORD_PATTERN.findall(claim.lower()), return_counts=True)
+        dots = np.zeros(len(self.sentences))
+        claim_norm = 0.0
+        for term, count in zip(terms, counts):
+            postings = self.postings(term)
+            term_id = self.vocabulary.get(term)
+            weight = count * (self.idf[term_id] if term_id is not None else self.unseen_idf)
+            claim_norm += weight ** 2
+            dots += np.bincount(self.posting_sentences[postings], self.weights[postings] * weight,
+                                minlength=len(self.sentences))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.nan_to_num(dots / (self.norms * np.sqrt(claim_norm)))
+
+    def find_matches(self, claim, entities, threshold=SIMILARITY_THRESHOLD):
+        """
+        Sentences that mention one of the entities and are similar enough to the claim.
+
+        :param claim: Claim text
+        :param entities: Entity strings, e.g. the texts of the claim's named entities
+        :param threshold: Minimum cosine similarity
+        :return: Matching sentences, in corpus order
+        """
+        if not entities:
+            return []
+        candidates = np.unique(np.concatenate([self.sentences_with(entity) for entity in entities]))
+        similarities = self.similarities(claim)[candidates]
+        return [self.sentences[i] for i in candidates[similarities >= threshold]]
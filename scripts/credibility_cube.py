@@ -0,0 +1,105 @@
+import pandas as pd
+
+from scripts.dataset_operators import read_dataset
+from scripts.path_operators import get_datasets_dir
+
+CUBE_FILE = "credibility_cube.parquet"
+CUBE_KEYS = ["author", "party", "orientation", "month"]
+
+
+def build_cube(df):
+    """
+    Aggregate the processed fact-checking rows into an author x party x orientation x month cube.
+
+    :param df: Processed DataFrame with author, party, orientation, date and score columns
+    :return: DataFrame with one row per cell and score_sum, count and score_sq_sum columns
+    """
+    scores = df["score"].astype("int64")
+    cells = df[["author", "party", "orientation"]].assign(
+        month=df["date"].dt.to_period("M").dt.to_timestamp(),
+        score=scores,
+        score_sq=scores ** 2,
+    )
+    cube = cells.groupby(CUBE_KEYS, observed=True, dropna=False).agg(
+        score_sum=("score", "sum"),
+        count=("score", "size"),
+        score_sq_sum=("score_sq", "sum"),
+    )
+    return cube.reset_index()
+
+
+class CredibilityCube:
+    """
+    Query API over the precomputed credibility cube.
+
+    Every query works on the handful of monthly cells instead of the raw rows, and
+    the sums are additive, so any slice can be rolled up without rescanning the data.
+    """
+
+    def __init__(self, cells):
+        self.cells = cells
+
+    @classmethod
+    def load(cls, file_path=None):
+        return cls(read_dataset(file_path or get_datasets_dir(CUBE_FILE)))
+
+    def slice(self, start=None, end=None, orientations=None):
+        """
+        Restrict the cube to a date range and a set of orientations.
+
+        :param start: First month to keep, anything pd.Timestamp accepts
+        :param end: Last month to keep, anything pd.Timestamp accepts
+        :param orientations: Orientations to keep, e.g. ["destra", "centro"]
+        :return: New CredibilityCube with the selected cells
+        """
+        mask = pd.Series(True, index=self.cells.index)
+        if start is not None:
+            mask &= self.cells["month"] >= pd.Timestamp(start).to_period("M").to_timestamp()
+        if end is not None:
+            mask &= self.cells["month"] <= pd.Timestamp(end)
+        if orientations is not None:
+            mask &= self.cells["orientation"].isin(orientations)
+        return CredibilityCube(self.cells[mask])
+
+    def totals(self, column):
+        """
+        Roll the additive sums of the cube up to one row per value of a column.
+
+        :param column: Cube key to group by, e.g. "author" or "party"
+        :return: DataFrame indexed by column with score_sum, count and score_sq_sum
+        """
+        return self.cells.groupby(column, observed=True)[["score_sum", "count", "score_sq_sum"]].sum()
+
+    def by(self, column):
+        """
+        Roll the cube up to one row per value of a column.
+
+        :param column: Cube key to group by, e.g. "author" or "party"
+        :return: DataFrame with column, mean, count and std of the scores
+        """
+        grouped = self.totals(column)
+        mean = grouped["score_sum"] / grouped["count"]
+        variance = (grouped["score_sq_sum"] / grouped["count"] - mean ** 2).clip(lower=0)
+        return pd.DataFrame({
+            "mean": mean,
+            "count": grouped["count"],
+            "std": variance ** 0.5,
+        }).reset_index()
+
+    def score_counts(self, column):
+        """
+        Number of -1, 0 and 1 scores per value of a column.
+
+        With scores in {-1, 0, 1}, the sum and the sum of squares are enough to
+        recover how many scores of each kind fall in every cell.
+
+        :param column: Cube key to group by, e.g. "author"
+        :return: Long DataFrame with column, score and n columns
+        """
+        grouped = self.totals(column)
+        counts = pd.DataFrame({
+            -1: (grouped["score_sq_sum"] - grouped["score_sum"]) // 2,
+            0: grouped["count"] - grouped["score_sq_sum"],
+            1: (grouped["score_sq_sum"] + grouped["score_sum"]) // 2,
+        })
+        return counts.rename_axis(columns="score").stack().rename("n").reset_index()
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+
+BOOTSTRAP_SAMPLES = 2000
+CONFIDENCE_LEVEL = 0.95
+SCORE_VALUES = np.array([-1, 0, 1])
+
+
+def estimate_prior(totals):
+    """
+    Empirical-Bayes prior of the group means, estimated with the method of moments.
+
+    The within-group variance comes from the pooled sums of squares, the between-group
+    variance from the spread of the group means that the sampling noise does not explain.
+
+    :param totals: DataFrame with score_sum, count and score_sq_sum per group
+    :return: Tuple (prior_mean, prior_strength); prior_strength is measured in cards
+    """
+    counts = totals["count"].to_numpy(dtype="float64")
+    sums = totals["score_sum"].to_numpy(dtype="float64")
+    sq_sums = totals["score_sq_sum"].to_numpy(dtype="float64")
+    n_total, n_groups = counts.sum(), len(counts)
+    prior_mean = sums.sum() / n_total
+    if n_groups < 2 or n_total <= n_groups:
+        return prior_mean, 0.0
+
+    means = sums / counts
+    within = (sq_sums - counts * means ** 2).sum() / (n_total - n_groups)
+    between = ((counts * (means - prior_mean) ** 2).sum() - (n_groups - 1) * within) / (
+        n_total - (counts ** 2).sum() / n_total
+    )
+    if within <= 0:
+        return prior_mean, 0.0
+    if between <= 0:
+        # The groups are indistinguishable from noise: everyone is pulled to the global mean
+        return prior_mean, np.inf
+    return prior_mean, within / between
+
+
+def shrink(sums, counts, prior_mean, prior_strength):
+    if np.isinf(prior_strength):
+        return np.full(np.shape(sums), prior_mean)
+    return (sums + prior_strength * prior_mean) / (counts + prior_strength)
+
+
+def bootstrap_intervals(score_counts, prior_mean, prior_strength, n_samples=BOOTSTRAP_SAMPLES,
+                        confidence=CONFIDENCE_LEVEL, seed=42):
+    """
+    Bayesian bootstrap intervals of the shrunk scores, for all groups at once.
+
+    Scores only take the values -1, 0 and 1, so a resample of a group is a set of weights
+    over its three score counts. The weights are Dirichlet draws over the observed counts
+    plus prior_strength pseudo-cards spread like the global scores, so their average is
+    exactly the shrunk score and groups with a single card still get a non-empty interval.
+    All groups and all resamples are drawn in a single (n_samples, n_groups, 3) array.
+
+    :param score_counts: Array (n_groups, 3) with the number of -1, 0 and 1 scores
+    :param prior_mean: Prior mean from estimate_prior
+    :param prior_strength: Prior strength from estimate_prior
+    :param n_samples: Number of bootstrap resamples
+    :param confidence: Coverage of the intervals
+    :param seed: Seed of the random generator, fixed so reports are reproducible
+    :return: Tuple (low, high) of arrays with one bound per group
+    """
+    if np.isinf(prior_strength):
+        constant = np.full(len(score_counts), prior_mean)
+        return constant, constant
+    global_shares = score_counts.sum(axis=0) / score_counts.sum()
+    concentration = score_counts + prior_strength * global_shares
+    rng = np.random.default_rng(seed)
+    # Dirichlet draws as normalized gamma draws, which unlike rng.dirichlet broadcast over groups
+    weights = rng.standard_gamma(concentration, size=(n_samples, *concentration.shape))
+    resampled = (weights / weights.sum(axis=2, keepdims=True)) @ SCORE_VALUES
+    tail = (1 - confidence) / 2
+    low, high = np.quantile(resampled, [tail, 1 - tail], axis=0)
+    return low, high
+
+
+def rank_credibility(totals, n_samples=BOOTSTRAP_SAMPLES, confidence=CONFIDENCE_LEVEL, seed=42):
+    """
+    Shrunk credibility scores and bootstrap confidence intervals per group.
+
+    Groups with few cards are pulled towards the global mean, so a single card can no
+    longer put an author at the top or the bottom of the rankings.
+
+    :param totals: DataFrame indexed by group with score_sum, count and score_sq_sum, as CredibilityCube.totals
+    :param n_samples: Number of bootstrap resamples
+    :param confidence: Coverage of the intervals
+    :param seed: Seed of the random generator
+    :return: DataFrame with the group, mean, count, shrunk_score, ci_low and ci_high columns
+    """
+    sums = totals["score_sum"].to_numpy(dtype="int64")
+    counts = totals["count"].to_numpy(dtype="int64")
+    sq_sums = totals["score_sq_sum"].to_numpy(dtype="int64")
+    score_counts = np.column_stack([(sq_sums - sums) // 2, counts - sq_sums, (sq_sums + sums) // 2])
+
+    prior_mean, prior_strength = estimate_prior(totals)
+    low, high = bootstrap_intervals(score_counts, prior_mean, prior_strength, n_samples, confidence, seed)
+    return pd.DataFrame({
+        "mean": sums / counts,
+        "count": counts,
+        "shrunk_score": shrink(sums, counts, prior_mean, prior_strength),
+        "ci_low": low,
+        "ci_high": high,
+    }, index=totals.index).reset_index()
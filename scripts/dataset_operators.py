@@ -0,0 +1,85 @@
+import shutil
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from scripts.path_operators import get_datasets_dir
+
+RAW_DATASET = "fact_checking_with_verdict"
+LEGACY_RAW_FILE = "fact_checking_with_verdict.parquet"
+PARTITION_COLUMN = "scrape_month"
+LEGACY_PARTITION = "legacy"
+PARTITIONING = ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.string())]), flavor="hive")
+
+
+def read_dataset(path, columns=None, filters=None, types_mapper=None):
+    """
+    Read a single Parquet file or a partitioned dataset directory through pyarrow.dataset.
+
+    :param path: Path to a Parquet file or to a directory of partitioned fragments
+    :param columns: Columns to read, all data columns by default
+    :param filters: Optional pyarrow expression pushed down to the scan, e.g. ds.field("party") == "Lega"
+    :param types_mapper: Optional mapping from Arrow types to pandas dtypes, as in Table.to_pandas
+    :return: DataFrame with the selected rows and columns
+    """
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"The dataset {path} does not exist.")
+    dataset = ds.dataset(path, format="parquet", partitioning=PARTITIONING if path.is_dir() else None)
+    if columns is None:
+        columns = [name for name in dataset.schema.names if name != PARTITION_COLUMN]
+    return dataset.to_table(columns=columns, filter=filters).to_pandas(date_as_object=False, types_mapper=types_mapper)
+
+
+def new_fragment_path(partition_dir):
+    return partition_dir / f"part-{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}.parquet"
+
+
+def append_fragment(df, path, partition_value=None):
+    # New rows land in a fresh fragment of the current scrape month, existing fragments are never rewritten
+    partition_value = partition_value or datetime.now().strftime("%Y-%m")
+    partition_dir = Path(path) / f"{PARTITION_COLUMN}={partition_value}"
+    partition_dir.mkdir(parents=True, exist_ok=True)
+    fragment_path = new_fragment_path(partition_dir)
+    df.to_parquet(fragment_path, index=False, engine="pyarrow")
+    return fragment_path
+
+
+def migrate_legacy_file(legacy_path, path):
+    # A dataset still stored as one Parquet file becomes the "legacy" partition of the directory layout
+    legacy_path = Path(legacy_path)
+    if not legacy_path.is_file():
+        return
+    partition_dir = Path(path) / f"{PARTITION_COLUMN}={LEGACY_PARTITION}"
+    partition_dir.mkdir(parents=True, exist_ok=True)
+    shutil.move(legacy_path, partition_dir / "part-legacy.parquet")
+    print(f"Moved {legacy_path} into {partition_dir}")
+
+
+def compact_dataset(path, id_column="id"):
+    # Merge the fragments of every partition into one, dropping rows appended twice
+    for partition_dir in sorted(Path(path).glob(f"{PARTITION_COLUMN}=*")):
+        fragments = sorted(partition_dir.glob("*.parquet"))
+        if len(fragments) < 2:
+            continue
+        df = pd.concat([pd.read_parquet(fragment) for fragment in fragments], ignore_index=True)
+        df = df.drop_duplicates(subset=id_column)
+        # The compacted fragment is written before the old ones are removed, readers dedupe by id meanwhile
+        df.to_parquet(new_fragment_path(partition_dir), index=False, engine="pyarrow")
+        for fragment in fragments:
+            fragment.unlink()
+        print(f"Compacted {len(fragments)} fragments in {partition_dir.name} into {len(df)} rows")
+
+
+def main():
+    dataset_path = get_datasets_dir(RAW_DATASET)
+    migrate_legacy_file(get_datasets_dir(LEGACY_RAW_FILE), dataset_path)
+    compact_dataset(dataset_path)
+
+
+if __name__ == "__main__":
+    main()
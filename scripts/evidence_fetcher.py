@@ -0,0 +1,199 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from scripts.http_operators import create_http_session
+
+FACT_CHECK_URL = "https://factchecktools.googleapis.com/v1alpha1/claims:search"
+WIKIPEDIA_API_URL = "https://en.wikipedia.org/w/api.php"
+NEWSAPI_URL = "https://newsapi.org/v2/everything"
+SOURCES = ("google_fact_check", "wikipedia", "newsapi")
+
+# Seconds a single request to each source may take
+SOURCE_TIMEOUTS = {"google_fact_check": 5, "wikipedia": 5, "newsapi": 8}
+# A second, identical request is raced against the first if it hasn't answered after this many seconds
+HEDGE_DELAYS = {"google_fact_check": 1.5, "wikipedia": 1.0, "newsapi": 2.0}
+# Sources still pending when the deadline expires are cancelled and reported as None
+CLAIM_DEADLINE = 10
+CLAIM_CONCURRENCY = 8
+# Room for every request of the claims in flight and its hedge, so requests don't wait for a worker
+FETCH_WORKERS = CLAIM_CONCURRENCY * len(SOURCES) * 2
+
+
+class EvidenceFetcher:
+    """
+    Fetch evidence for claims from several sources concurrently on one event loop.
+
+    The blocking calls run on a bounded thread pool over a single pooled HTTP session, so
+    every claim and every source share the same keep-alive connections. A slow source is
+    hedged with a duplicate request and dropped at the deadline instead of holding up the others.
+    """
+
+    def __init__(self, api_keys=None, session=None, base_urls=None, timeouts=None, hedge_delays=None,
+                 deadline=CLAIM_DEADLINE, max_workers=FETCH_WORKERS, rate_limiters=None, cache=None):
+        self.api_keys = api_keys or {}
+        # Hedged requests replace retries, a retry would only push the answer past the deadline
+        self.session = session or create_http_session(max_connections_per_host=max_workers, retries=0)
+        self.base_urls = {
+            "google_fact_check": FACT_CHECK_URL,
+            "wikipedia": WIKIPEDIA_API_URL,
+            "newsapi": NEWSAPI_URL,
+            **(base_urls or {}),
+        }
+        self.timeouts = {**SOURCE_TIMEOUTS, **(timeouts or {})}
+        self.hedge_delays = {**HEDGE_DELAYS, **(hedge_delays or {})}
+        self.deadline = deadline
+        # Dictionary from source to RateLimiter, sources without one are not limited
+        self.rate_limiters = rate_limiters or {}
+        # ResponseCache keyed on (source, claim), None disables caching
+        self.cache = cache
+        # Fetches in flight by (source, claim), awaited by every lookup of the same key
+        self.in_flight = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def get_json(self, source, params):
+        response = self.session.get(self.base_urls[source], params=params, timeout=self.timeouts[source])
+        response.raise_for_status()
+        return response.json()
+
+    def submit(self, fetch, claim):
+        """
+        Run a fetch on the thread pool.
+
+        :param fetch: Blocking fetch method
+        :param claim: Standardized claim
+        :return: Tuple (request, started) of futures, started is done once a worker picks the request up
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.create_future()
+
+        def run():
+            loop.call_soon_threadsafe(lambda: started.done() or started.set_result(None))
+            return fetch(claim)
+
+        return loop.run_in_executor(self.executor, run), started
+
+    def fetch_google_fact_check(self, claim):
+        data = self.get_json("google_fact_check", {"query": claim, "key": self.api_keys.get("google_fact_check")})
+        return data.get("claims", [])
+
+    def fetch_wikipedia(self, claim):
+        # Search and plain-text extract of the best hit in a single call, instead of a search then a page download
+        data = self.get_json("wikipedia", {
+            "action": "query",
+            "generator": "search",
+            "gsrsearch": claim,
+            "gsrlimit": 1,
+            "prop": "extracts",
+            "explaintext": 1,
+            "format": "json",
+            "utf8": 1,
+        })
+        pages = data.get("query", {}).get("pages", {})
+        return next((page.get("extract") for page in pages.values()), None)
+
+    def fetch_newsapi(self, claim):
+        data = self.get_json("newsapi", {"q": claim, "apiKey": self.api_keys.get("newsapi")})
+        return " ".join(article["content"] for article in data.get("articles", []) if article.get("content"))
+
+    async def fetch_source(self, source, claim):
+        """
+        Fetch one source, racing a hedged duplicate request if the first one is slow.
+
+        Cached responses are returned without a request and without using the rate limit budget,
+        and concurrent lookups of the same claim share a single fetch.
+
+        :param source: One of SOURCES
+        :param claim: Standardized claim
+        :return: Parsed response of the first request to succeed, None if both fail
+        """
+        if self.cache is not None:
+            found, response = self.cache.get_memory(source, claim)
+            if found:
+                return response
+        key = (source, claim)
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.fetch_uncached(source, claim))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        # Shielded, so a claim dropped at its deadline doesn't cancel the fetch for the others waiting on it
+        return await asyncio.shield(task)
+
+    async def fetch_uncached(self, source, claim):
+        if self.cache is not None:
+            # The disk tier blocks on SQLite, so it runs off the event loop
+            found, response = await asyncio.to_thread(self.cache.get, source, claim)
+            if found:
+                return response
+        fetch = getattr(self, f"fetch_{source}")
+        limiter = self.rate_limiters.get(source)
+        # Waiting for a slot past the deadline is pointless, the source would be dropped anyway
+        if limiter is not None and not await limiter.acquire_async(timeout=self.deadline):
+            print(f"{source} rate limit reached, skipping the source")
+            return None
+        # Counted from here, so the wait for a rate limit slot is not reported as latency saved by the cache
+        start_time = time.perf_counter()
+        request, started = self.submit(fetch, claim)
+        pending = {request}
+        hedged = False
+        try:
+            # A request queued behind others is not slow: the hedge delay counts from when it starts running
+            await asyncio.wait({request, started}, return_when=asyncio.FIRST_COMPLETED)
+            while pending:
+                timeout = None if hedged else self.hedge_delays[source]
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if self.cache is not None:
+                            latency = time.perf_counter() - start_time
+                            await asyncio.to_thread(self.cache.set, source, claim, future.result(), latency)
+                        return future.result()
+                    print(f"{source} request failed: {future.exception()}")
+                if not done and not hedged:
+                    # A hedge is only sent if the budget has room for it right now
+                    if limiter is None or limiter.try_acquire():
+                        pending.add(self.submit(fetch, claim)[0])
+                    hedged = True
+            return None
+        finally:
+            # The losing request's result is ignored; a request already on the wire finishes within its timeout
+            started.cancel()
+            for future in pending:
+                future.cancel()
+
+    async def fetch_all(self, claim, sources=SOURCES):
+        """
+        Fetch every source for a claim concurrently, within the fetcher's deadline.
+
+        :param claim: Standardized claim
+        :param sources: Sources to query
+        :return: Dictionary from source to its result, None for sources that failed or missed the deadline
+        """
+        start_time = time.perf_counter()
+        tasks = {source: asyncio.create_task(self.fetch_source(source, claim)) for source in sources}
+        done, pending = await asyncio.wait(tasks.values(), timeout=self.deadline)
+        for task in pending:
+            task.cancel()
+        results = {
+            source: task.result() if task in done else None
+            for source, task in tasks.items()
+        }
+        late = [source for source, task in tasks.items() if task in pending]
+        if late:
+            print(f"Deadline of {self.deadline}s reached after {time.perf_counter() - start_time:.1f}s, dropped: {late}")
+        return results
+
+    async def fetch_many(self, claims, sources=SOURCES, concurrency=CLAIM_CONCURRENCY):
+        # Bounded number of claims in flight, each with its own deadline
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch_one(claim):
+            async with semaphore:
+                return await self.fetch_all(claim, sources)
+
+        return await asyncio.gather(*(fetch_one(claim) for claim in claims))
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
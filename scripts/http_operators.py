@@ -0,0 +1,21 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+REQUEST_TIMEOUT = 10
+MAX_CONNECTIONS_PER_HOST = 4
+
+
+def create_http_session(max_connections_per_host=MAX_CONNECTIONS_PER_HOST, retries=3, backoff_factor=0.5):
+    # Keep-alive connection pool shared by all workers; pool_block caps concurrent connections per host
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+    )
+    adapter = HTTPAdapter(pool_maxsize=max_connections_per_host, pool_block=True, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -0,0 +1,83 @@
+import sqlite3
+import threading
+import time
+
+DAY_SECONDS = 24 * 60 * 60
+
+
+class ImageCache:
+    """
+    Persistent cache of image lookups keyed by query, stored in a SQLite file.
+
+    Pinned entries always win over the stored ones, and "not found" results (None)
+    are cached as well so that missing pages are not requested again until they expire.
+    """
+
+    def __init__(self, db_path, ttl_days=30, negative_ttl_days=7, pinned=None):
+        self.ttl = ttl_days * DAY_SECONDS
+        self.negative_ttl = negative_ttl_days * DAY_SECONDS
+        self.pinned = dict(pinned or {})
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS images ("
+            "query TEXT PRIMARY KEY, url TEXT, fetched_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def get(self, query):
+        """
+        Look up a query without fetching it.
+
+        :param query: Lookup key, e.g. an author or party name
+        :return: Tuple (found, url); url is None for cached "not found" results
+        """
+        if query in self.pinned:
+            return True, self.pinned[query]
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT url, fetched_at FROM images WHERE query = ?", (query,)
+            ).fetchone()
+        if row is None:
+            return False, None
+        url, fetched_at = row
+        ttl = self.ttl if url is not None else self.negative_ttl
+        if time.time() - fetched_at > ttl:
+            return False, None
+        return True, url
+
+    def set(self, query, url):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO images (query, url, fetched_at) VALUES (?, ?, ?)",
+                (query, url, time.time()),
+            )
+            self.conn.commit()
+
+    def fetch(self, query, fetcher):
+        """
+        Return the cached image for a query, calling the fetcher only on a miss.
+
+        :param query: Lookup key, e.g. an author or party name
+        :param fetcher: Callable taking the query and returning an image URL or None
+        :return: Image URL or None
+        """
+        found, url = self.get(query)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if found:
+            return url
+        url = fetcher(query)
+        self.set(query, url)
+        return url
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        self.conn.close()
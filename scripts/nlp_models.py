@@ -0,0 +1,65 @@
+import threading
+
+import spacy
+
+ENGLISH_MODEL = "en_core_web_sm"
+ITALIAN_MODEL = "it_core_news_sm"
+# Components the entity recognizer needs, the tagger, parser and lemmatizer stay disabled
+NER_PIPES = ("tok2vec", "ner")
+NER_BATCH_SIZE = 256
+
+_models = {}
+# Models that could not be loaded or downloaded, so the network is only tried once per process
+_failed_models = {}
+_models_lock = threading.Lock()
+
+
+def load_model(name, enable=NER_PIPES):
+    """
+    Return a spaCy pipeline shared by the whole process, loading it on first use.
+
+    :param name: Package name of the model, e.g. "it_core_news_sm"
+    :param enable: Components to enable, all others are disabled
+    :return: spaCy Language object
+    :raises OSError: If the model is not installed and cannot be downloaded
+    """
+    key = (name, tuple(enable))
+    with _models_lock:
+        if name in _failed_models:
+            raise OSError(_failed_models[name])
+        if key not in _models:
+            try:
+                _models[key] = spacy.load(name, enable=list(enable))
+            except OSError:
+                print(f"Downloading the spacy model {name}...")
+                from spacy.cli import download
+
+                try:
+                    download(name)
+                except (Exception, SystemExit) as e:
+                    # spacy.cli reports a failed download by exiting, or raises on a missing network
+                    _failed_models[name] = f"The spacy model {name} is not installed and could not be downloaded: {e!r}"
+                    raise OSError(_failed_models[name]) from e
+                _models[key] = spacy.load(name, enable=list(enable))
+        return _models[key]
+
+
+def preload_models(*names):
+    # Load the models up front, e.g. before a server forks its workers
+    for name in names:
+        load_model(name)
+
+
+def extract_entities_batch(texts, model=ITALIAN_MODEL, batch_size=NER_BATCH_SIZE, n_process=1):
+    """
+    Run the entity recognizer over a stream of texts with nlp.pipe.
+
+    :param texts: Iterable of texts, consumed lazily
+    :param model: Package name of the model
+    :param batch_size: Number of texts per batch
+    :param n_process: Number of worker processes
+    :return: Generator with one list of (text, label) tuples per input text
+    """
+    nlp = load_model(model)
+    for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process):
+        yield [(ent.text, ent.label_) for ent in doc.ents]
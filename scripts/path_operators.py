@@ -11,3 +11,11 @@ def get_datasets_dir(path: str) -> Path:
 
 def get_firebase_key_path() -> Path:
     return get_project_root() / "key_firebase.json"
+
+
+def get_reports_dir() -> Path:
+    return get_project_root() / "reports"
+
+
+def get_fixtures_dir(path: str) -> Path:
+    return get_project_root() / "fixtures" / path
@@ -1,11 +1,24 @@
+import argparse
 import re
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 import requests
 from bs4 import BeautifulSoup
 
+from scripts.credibility_cube import CUBE_FILE, build_cube
+from scripts.dataset_operators import RAW_DATASET, read_dataset
+from scripts.http_operators import REQUEST_TIMEOUT, create_http_session
+from scripts.image_cache import ImageCache
+from scripts.nlp_models import ITALIAN_MODEL, extract_entities_batch
 from scripts.path_operators import get_datasets_dir
+from scripts.schemas import PROCESSED_SCHEMA, enforce_processed_schema, read_processed_dataset
+from scripts.search_index import update_search_index
 
 NEGATIVE_KEYWORDS = [
     "falsa", "scorretta", "sbagliata", "non è supportata", "non stanno proprio",
@@ -37,6 +50,15 @@ MONTHS_IT = {
     "OTTOBRE": "October", "NOVEMBRE": "November", "DICEMBRE": "December",
 }
 
+MONTHS_IT_PATTERN = re.compile("|".join(MONTHS_IT))
+
+DATE_FORMATS = (
+    "%d %B %Y", "%d %b %Y", "%B %Y", "%b %Y",
+    "%d %B", "%d %b", "%B", "%b",
+)
+
+DEFAULT_DATE = pd.Timestamp("1900-01-01")
+
 PARTY_ORIENTATION = {
     'Alleanza Verdi e Sinistra': 'sinistra', 'Azione': 'destra', 'Europa Verde': 'sinistra',
     'Forza Italia': 'destra', 'Fratelli d\'Italia': 'destra', 'Impegno Civico': 'destra',
@@ -45,6 +67,18 @@ PARTY_ORIENTATION = {
     'Più Europa': 'sinistra', 'Sinistra Italiana': 'sinistra', 'Tecnico': 'centro',
 }
 
+IMAGE_CACHE_FILE = "image_cache.sqlite"
+
+WIKIPEDIA_BASE_URL = "https://it.wikipedia.org"
+IMAGE_WORKERS = 8
+
+# Windows of the rolling credibility scores, counted back from the most recent card
+ROLLING_WINDOWS = {
+    "90d": pd.DateOffset(days=90),
+    "12m": pd.DateOffset(months=12),
+}
+DECAY_HALF_LIFE_DAYS = 180
+
 IMAGE_EXCEPTIONS = {
     'Partito Democratico': 'https://upload.wikimedia.org/wikipedia/it/thumb/4/4a/Logo_Partito_Democratico.svg/150px-Logo_Partito_Democratico.svg.png',
     'Impegno Civico': 'https://upload.wikimedia.org/wikipedia/it/thumb/a/a4/Impegno_Civico_%28Italia%2C_2023%29_-_Logo.png/220px-Impegno_Civico_%28Italia%2C_2023%29_-_Logo.png',
@@ -52,45 +86,63 @@ IMAGE_EXCEPTIONS = {
 }
 
 
-def load_dataset(file_path):
-    return pd.read_parquet(file_path)
+def compile_keyword_pattern(keywords):
+    # Single word-bounded alternation, compiled once instead of one regex per keyword per row
+    alternation = "|".join(re.escape(kw) for kw in keywords)
+    return re.compile(rf"\b(?:{alternation})\b")
+
+
+NEGATIVE_PATTERN = compile_keyword_pattern(NEGATIVE_KEYWORDS)
+NEUTRAL_PATTERN = compile_keyword_pattern(NEUTRAL_KEYWORDS)
+POSITIVE_PATTERN = compile_keyword_pattern(POSITIVE_KEYWORDS)
+
+
+def load_dataset(file_path, columns=None, filters=None):
+    return read_dataset(file_path, columns=columns, filters=filters)
 
 
 def classify_verdict(verdict):
     verdict = verdict.lower()
-    if any(re.search(rf"\b{kw}\b", verdict) for kw in NEGATIVE_KEYWORDS):
+    if NEGATIVE_PATTERN.search(verdict):
         return -1
-    elif any(re.search(rf"\b{kw}\b", verdict) for kw in NEUTRAL_KEYWORDS):
+    elif NEUTRAL_PATTERN.search(verdict):
         return 0
-    elif any(re.search(rf"\b{kw}\b", verdict) for kw in POSITIVE_KEYWORDS):
+    elif POSITIVE_PATTERN.search(verdict):
         return 1
     else:
         return 0  # Default to neutral if no keywords are found
 
 
-def standardize_date(date_str):
-    if pd.isna(date_str) or date_str.strip() == "":
-        return "1900-01-01"  # Assign a default old date for missing or empty dates
+def classify_verdicts(verdicts):
+    # Vectorized classify_verdict: same negative > neutral > positive precedence, neutral by default
+    lowered = verdicts.str.lower()
+    scores = np.select(
+        [
+            lowered.str.contains(NEGATIVE_PATTERN, na=False),
+            lowered.str.contains(NEUTRAL_PATTERN, na=False),
+            lowered.str.contains(POSITIVE_PATTERN, na=False),
+        ],
+        [-1, 0, 1],
+        default=0,
+    )
+    return pd.Series(scores, index=verdicts.index, dtype="int64")
 
-    for it_month, en_month in MONTHS_IT.items():
-        date_str = date_str.replace(it_month, en_month)
 
-    for date_format in (
-            "%d %B %Y", "%d %b %Y", "%B %Y", "%b %Y",
-            "%d %B", "%d %b", "%B", "%b",
-    ):
-        try:
-            parsed_date = datetime.strptime(date_str, date_format)
-            if parsed_date.year == 1900:
-                parsed_date = parsed_date.replace(year=1900)
-            if parsed_date.month == 1 and "%B" not in date_format and "%b" not in date_format:
-                parsed_date = parsed_date.replace(month=1)
-            if parsed_date.day == 1 and "%d" not in date_format:
-                parsed_date = parsed_date.replace(day=1)
-            return parsed_date.strftime("%Y-%m-%d")
-        except ValueError:
-            pass
-    return "1900-01-01"  # Return default old date if no format matches
+def standardize_dates(dates):
+    # Parse each distinct date string once: the corpus repeats the same dates thousands of times
+    distinct = pd.Series(dates.dropna().unique(), dtype="object")
+    translated = distinct.str.replace(MONTHS_IT_PATTERN, lambda match: MONTHS_IT[match.group(0)], regex=True)
+
+    parsed = pd.Series(pd.NaT, index=distinct.index, dtype="datetime64[ns]")
+    for date_format in DATE_FORMATS:
+        pending = parsed.isna()
+        if not pending.any():
+            break
+        parsed[pending] = pd.to_datetime(translated[pending], format=date_format, errors="coerce")
+
+    # Missing, empty or unparseable dates get a default old date
+    lookup = pd.Series(parsed.fillna(DEFAULT_DATE).values, index=distinct.values)
+    return dates.map(lookup).fillna(DEFAULT_DATE).astype("datetime64[ns]")
 
 
 def standardize_party_name(party):
@@ -136,11 +188,17 @@ def add_party_orientation(df):
     return df
 
 
-def fetch_wikipedia_image(query):
-    def get_image_from_page(page_url):
-        page_response = requests.get(page_url)
-        soup = BeautifulSoup(page_response.content, 'html.parser')
+def fetch_wikipedia_image(query, session=None, base_url=WIKIPEDIA_BASE_URL):
+    http = session or requests
+
+    def get_page(page_url):
+        page_response = http.get(page_url, timeout=REQUEST_TIMEOUT)
+        # A missing page is a result worth caching, any other error page is a failed lookup
+        if page_response.status_code != 404:
+            page_response.raise_for_status()
+        return BeautifulSoup(page_response.content, 'html.parser')
 
+    def get_image_from_page(soup):
         # Check common infobox classes
         infobox = soup.find('table', class_='infobox') or soup.find('table', 'vcard')
         if infobox:
@@ -163,10 +221,7 @@ def fetch_wikipedia_image(query):
                     links.append((a_tag['href'], description))
         return links
 
-    def resolve_disambiguation_page(page_url):
-        page_response = requests.get(page_url)
-        soup = BeautifulSoup(page_response.content, 'html.parser')
-
+    def resolve_disambiguation_page(soup):
         disambiguation_links = extract_disambiguation_links(soup)
 
         if disambiguation_links:
@@ -178,9 +233,9 @@ def fetch_wikipedia_image(query):
 
             # Select the most relevant link
             if exact_matches:
-                return f"https://it.wikipedia.org{exact_matches[0]}"
+                return f"{base_url}{exact_matches[0]}"
             elif generic_matches:
-                return f"https://it.wikipedia.org{generic_matches[-1]}"
+                return f"{base_url}{generic_matches[-1]}"
 
             # Check for "Politica" section links if no matches are found
             politica_heading = soup.find(id='Politica')
@@ -193,34 +248,30 @@ def fetch_wikipedia_image(query):
                             description = li.get_text()
                             a_tag = li.find('a', href=True)
                             if 'partito politico' in description.lower() and a_tag:
-                                return f"https://it.wikipedia.org{a_tag['href']}"
+                                return f"{base_url}{a_tag['href']}"
 
             # If still no match, return the last valid link
-            return f"https://it.wikipedia.org{disambiguation_links[-1][0]}"
+            return f"{base_url}{disambiguation_links[-1][0]}"
 
         return None
 
     print('query:', query)
 
-    if query in IMAGE_EXCEPTIONS:
-        return IMAGE_EXCEPTIONS[query]
-
-    page_url = f"https://it.wikipedia.org/wiki/{query}"
+    page_url = f"{base_url}/wiki/{query}"
     print(page_url)
-    page_response = requests.get(page_url)
-    soup = BeautifulSoup(page_response.content, 'html.parser')
+    soup = get_page(page_url)
 
     if is_disambiguation_page(soup):
         print('disambiguation')
-        resolved_url = resolve_disambiguation_page(page_url)
+        resolved_url = resolve_disambiguation_page(soup)
         if resolved_url:
-            img_url = get_image_from_page(resolved_url)
+            img_url = get_image_from_page(get_page(resolved_url))
             if img_url:
                 print(img_url)
                 return img_url
     else:
-        # Handle normal page
-        img_url = get_image_from_page(page_url)
+        # Handle normal page, reusing the already parsed content
+        img_url = get_image_from_page(soup)
         if img_url:
             print(img_url)
             return img_url
@@ -235,80 +286,289 @@ def process_dataset(df):
     df = df[df["author"].str.strip() != ""]
     df = df[df["party"].str.strip() != ""]
     df = df.drop_duplicates(subset=["id"])
-    df["date"] = df["date"].apply(standardize_date)
-    df["score"] = df["verdict"].apply(classify_verdict)
+    df["date"] = standardize_dates(df["date"])
+    df["score"] = classify_verdicts(df["verdict"])
     df["party"] = df["party"].apply(correct_party_name)
     df = add_party_orientation(df)
-    df = df.sort_values(by="date", ascending=False)
+    df["entities"] = extract_title_entities(df["title"])
+    return sort_cards(df)
+
+
+def extract_title_entities(titles, n_process=1):
+    # One streaming nlp.pipe pass over the titles, keeping the distinct entity texts of each
+    if titles.empty:
+        # No new titles, the model is not even loaded
+        return pd.Series([], index=titles.index, dtype=object)
+    try:
+        entities = list(extract_entities_batch(titles.astype(str), ITALIAN_MODEL, n_process=n_process))
+    except OSError as e:
+        # Entities are optional: the cards are stored with null entities and tagged on a later run
+        print(f'Warning: skipping entity tagging of {len(titles)} titles. {e}')
+        return pd.Series(None, index=titles.index, dtype=object)
+    return pd.Series([list(dict.fromkeys(text for text, label in ents)) for ents in entities], index=titles.index)
+
+
+def tag_untagged_cards(df):
+    # Null entities mark cards processed without the model, unlike an empty list of entities
+    untagged = df["entities"].isna()
+    if not untagged.any():
+        return df
+    print(f'{untagged.sum()} untagged cards to tag')
+    tagged = extract_title_entities(df.loc[untagged, "title"])
+    if tagged.isna().all():
+        return df
+    df = df.copy()
+    df.loc[tagged.index, "entities"] = tagged
     return df
 
 
-def add_first_and_last_date(original_df, df_group, groupby_col):
-    # Ensure the date column is in datetime format
-    original_df['date'] = pd.to_datetime(original_df['date'], errors='coerce')
-    # Exclude the placeholder date
-    original_df = original_df[original_df['date'].dt.year != 1900]
+def sort_cards(df):
+    # Newest first, ties broken by id so every build yields the same order
+    return df.sort_values(by=["date", "id"], ascending=[False, True], ignore_index=True)
+
+
+def summarize_scores(df, keys):
+    return df.groupby(keys, observed=True)['score'].agg(score_sum='sum', count='size')
+
+
+def summarize_details(df, groupby_col):
+    # First and last date (excluding the placeholder date) and the distinct sources of each group
+    dated = df[df['date'].dt.year != 1900]
+    dates = dated.groupby(groupby_col, observed=True)['date'].agg(first_date='min', last_date='max')
+    sources = df.groupby(groupby_col, observed=True)['source'].apply(lambda x: sorted(x.dropna().unique())).rename('sources')
+    return pd.concat([dates, sources], axis=1)
+
+
+def combine_details(*details):
+    stacked = pd.concat(details)
+    grouped = stacked.groupby(level=0)
+    dates = grouped.agg(first_date=('first_date', 'min'), last_date=('last_date', 'max'))
+    sources = grouped['sources'].apply(lambda lists: sorted(set().union(*lists))).rename('sources')
+    return pd.concat([dates, sources], axis=1)
+
+
+def assemble_grouped_table(scores, details, detail_col, image_column, image_cache, known_images=None):
+    keys = list(scores.index.names)
+    # Categorical keys of the processed dataset become plain strings in the aggregates
+    df_group = scores.reset_index().astype({key: object for key in keys})
+    details = details.set_axis(details.index.astype(object))
+    df_group['average_score'] = df_group['score_sum'] / df_group['count']
+    df_group = add_party_orientation(df_group[keys + ['average_score', 'count']])
+
+    # Only groups without a known image go through the resolver
+    known_images = known_images or {}
+    images = df_group[detail_col].map(known_images).astype(object)
+    missing = ~df_group[detail_col].isin(list(known_images))
+    if missing.any():
+        images[missing] = resolve_images(df_group.loc[missing, detail_col], image_cache)
+    df_group[image_column] = images
+
+    return df_group.merge(details, left_on=detail_col, right_index=True, how='left')
+
+
+def build_grouped_table(df, keys, detail_col, image_column, image_cache):
+    scores = summarize_scores(df, keys)
+    details = summarize_details(df, detail_col)
+    return assemble_grouped_table(scores, details, detail_col, image_column, image_cache)
+
+
+def update_grouped_table(df_group, df_new, keys, detail_col, image_column, image_cache):
+    # Fold the new rows into an existing aggregate: sums and counts add up, dates widen, sources merge
+    old_scores = df_group.set_index(keys)[['average_score', 'count']]
+    old_scores = pd.DataFrame({
+        'score_sum': (old_scores['average_score'] * old_scores['count']).round().astype('int64'),
+        'count': old_scores['count'],
+    })
+    scores = pd.concat([old_scores, summarize_scores(df_new, keys)]).groupby(level=keys).sum()
+
+    old_details = df_group.drop_duplicates(detail_col).set_index(detail_col)[['first_date', 'last_date', 'sources']]
+    details = combine_details(old_details, summarize_details(df_new, detail_col))
+
+    # Groups whose lookup failed or found nothing are looked up again, like in a full rebuild
+    known_images = {
+        name: image for name, image in zip(df_group[detail_col], df_group[image_column]) if pd.notna(image)
+    }
+    return assemble_grouped_table(scores, details, detail_col, image_column, image_cache, known_images)
+
+
+def add_rolling_scores(df, df_group, keys, as_of=None, windows=None, half_life_days=DECAY_HALF_LIFE_DAYS):
+    """
+    Add windowed and exponentially decayed average scores to an aggregate table.
+
+    Every window and the decay weights are computed as columns over all rows at once and
+    summed in a single groupby, so the cost grows linearly with the number of cards.
+    The reference date defaults to the most recent card, so the scores only move when new
+    cards arrive and unchanged entities are not re-uploaded by storage.py.
+
+    :param df: Processed DataFrame with the scored cards
+    :param df_group: Aggregate table to extend, with one row per group
+    :param keys: Columns identifying a group, e.g. ['author', 'party']
+    :param as_of: Reference date, the most recent card date by default
+    :param windows: Mapping from column suffix to DateOffset, ROLLING_WINDOWS by default
+    :param half_life_days: Age in days at which a card weighs half as much in decayed_score
+    :return: Aggregate table with score_<window>, count_<window> and decayed_score columns
+    """
+    windows = windows or ROLLING_WINDOWS
+    dated = df[df['date'].dt.year != 1900]
+    as_of = as_of or dated['date'].max()
+    scores = dated['score'].astype('float64')
+
+    columns = {}
+    for name, offset in windows.items():
+        in_window = (dated['date'] > as_of - offset) & (dated['date'] <= as_of)
+        columns[f'score_{name}'] = scores.where(in_window, 0.0)
+        columns[f'count_{name}'] = in_window.astype('int64')
+    age_days = (as_of - dated['date']).dt.days.clip(lower=0)
+    weights = np.exp2(-age_days / half_life_days)
+    columns['decay_sum'] = scores * weights
+    columns['decay_weight'] = weights
+
+    sums = pd.DataFrame(columns).join(dated[keys]).groupby(keys, observed=True).sum()
+    rolling = pd.DataFrame(index=sums.index)
+    for name in windows:
+        count = sums[f'count_{name}']
+        rolling[f'score_{name}'] = sums[f'score_{name}'] / count.where(count > 0)
+        rolling[f'count_{name}'] = count
+    rolling['decayed_score'] = sums['decay_sum'] / sums['decay_weight']
+    rolling = rolling.reset_index().astype({key: object for key in keys})
+
+    df_group = df_group.merge(rolling, on=keys, how='left')
+    # Groups with only placeholder dates have no card in any window
+    for name in windows:
+        df_group[f'count_{name}'] = df_group[f'count_{name}'].fillna(0).astype('int64')
+    return df_group
 
-    # Group by the relevant columns and calculate first and last date
-    date_info = original_df.groupby(groupby_col)['date'].agg(['min', 'max']).reset_index()
-    date_info.columns = [groupby_col, 'first_date', 'last_date']
 
-    # Merge the date_info back to the group dataframe
-    df_group = pd.merge(df_group, date_info, on=groupby_col, how='left')
+def save_dataset(df, file_path, schema=None):
+    if schema is None:
+        df.to_parquet(file_path, index=False, engine="pyarrow")
+        return
+    # Cast to the canonical on-disk schema: dictionary-encoded text, int8 score, date32 date
+    table = pa.Table.from_pandas(df[schema.names], preserve_index=False).cast(schema)
+    pq.write_table(table, file_path)
 
-    return df_group
 
+def resolve_images(queries, image_cache, session=None, max_workers=IMAGE_WORKERS, base_url=WIKIPEDIA_BASE_URL):
+    # Resolve each distinct query once on a bounded thread pool sharing one connection pool
+    owns_session = session is None
+    if owns_session:
+        session = create_http_session()
+    fetcher = partial(fetch_wikipedia_image, session=session, base_url=base_url)
 
-def add_sources_column(original_df, df_group, groupby_col):
-    sources = original_df.groupby(groupby_col)['source'].apply(lambda x: list(x.unique())).reset_index()
-    sources.columns = [groupby_col, 'sources']
+    def resolve(query):
+        try:
+            return image_cache.fetch(query, fetcher)
+        except requests.RequestException as e:
+            # Failed lookups are left uncached so the next run retries them
+            print(f'Image lookup failed for {query}: {e}')
+            return None
 
-    # Merge the sources back to the group dataframe
-    df_group = pd.merge(df_group, sources, on=groupby_col, how='left')
+    distinct_queries = list(dict.fromkeys(queries))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        images = dict(zip(distinct_queries, executor.map(resolve, distinct_queries)))
 
-    return df_group
+    if owns_session:
+        session.close()
+    return queries.map(images)
+
+
+def open_image_cache():
+    # IMAGE_EXCEPTIONS are pinned on top of the cached lookups
+    return ImageCache(get_datasets_dir(IMAGE_CACHE_FILE), pinned=IMAGE_EXCEPTIONS)
 
 
-def save_dataset(df, file_path):
-    df.to_parquet(file_path, index=False, engine="pyarrow")
+def create_grouped_parquets(df, image_cache):
+    df_author = build_grouped_table(df, ['author', 'party'], 'author', 'author_image', image_cache)
+    df_party = build_grouped_table(df, ['party'], 'party', 'party_image', image_cache)
+    df_author = add_rolling_scores(df, df_author, ['author', 'party'])
+    df_party = add_rolling_scores(df, df_party, ['party'])
+    return df_author, df_party
 
 
-def create_grouped_parquets(df):
-    df_author = df.groupby(['author', 'party']).agg(
-        average_score=('score', 'mean'),
-        count=('score', 'size')
-    ).reset_index()
-    df_author = add_party_orientation(df_author)
-    df_author['author_image'] = df_author['author'].apply(fetch_wikipedia_image)
+def update_grouped_parquets(df, df_author, df_party, df_new, image_cache):
+    df_author = update_grouped_table(df_author, df_new, ['author', 'party'], 'author', 'author_image', image_cache)
+    df_party = update_grouped_table(df_party, df_new, ['party'], 'party', 'party_image', image_cache)
+    # Windows slide with the newest card, so the rolling scores are recomputed over all rows
+    df_author = add_rolling_scores(df, df_author, ['author', 'party'])
+    df_party = add_rolling_scores(df, df_party, ['party'])
+    return df_author, df_party
 
-    df_party = df.groupby('party').agg(
-        average_score=('score', 'mean'),
-        count=('score', 'size')
-    ).reset_index()
-    df_party = add_party_orientation(df_party)
-    df_party['party_image'] = df_party['party'].apply(fetch_wikipedia_image)
 
-    # Add first and last date and sources information for parties
-    df_party = add_first_and_last_date(df, df_party, 'party')
-    df_party = add_sources_column(df, df_party, 'party')
+def rebuild_all(df_raw, image_cache):
+    df = enforce_processed_schema(process_dataset(df_raw))
+    df_author, df_party = create_grouped_parquets(df, image_cache)
+    return df, df_author, df_party
 
-    # Add first and last date and sources information for authors
-    df_author = add_first_and_last_date(df, df_author, 'author')
-    df_author = add_sources_column(df, df_author, 'author')
 
-    save_dataset(df_party, get_datasets_dir("average_by_party.parquet"))
-    save_dataset(df_author, get_datasets_dir("average_by_author.parquet"))
+def update_incremental(df_raw, df_processed, df_author, df_party, image_cache):
+    # Only cards whose id is not processed yet are cleaned, scored and folded into the aggregates
+    df_processed = tag_untagged_cards(df_processed)
+    df_new = process_dataset(df_raw[~df_raw["id"].isin(df_processed["id"])])
+    print(f'{len(df_new)} new cards to process')
+    if df_new.empty:
+        return df_processed, df_author, df_party
+    df = enforce_processed_schema(sort_cards(pd.concat([df_processed, df_new], ignore_index=True)))
+    df_author, df_party = update_grouped_parquets(df, df_author, df_party, df_new, image_cache)
+    return df, df_author, df_party
 
 
-def main():
-    input_path = get_datasets_dir("fact_checking_with_verdict.parquet")
+def verify_incremental(df_raw, df_processed, df_author, df_party, image_cache):
+    # The incremental outputs must match a full rebuild from the same raw dataset
+    incremental = update_incremental(df_raw, df_processed, df_author, df_party, image_cache)
+    full = rebuild_all(df_raw, image_cache)
+    for incremental_df, full_df in zip(incremental, full):
+        pd.testing.assert_frame_equal(incremental_df.reset_index(drop=True), full_df.reset_index(drop=True))
+    print('Incremental and full rebuild outputs are identical')
+
+
+def main(full_rebuild=False, verify=False):
+    input_path = get_datasets_dir(RAW_DATASET)
     output_path = get_datasets_dir("processed_fact_checking_with_scores.parquet")
-    df = load_dataset(input_path)
-    df = process_dataset(df)
-    save_dataset(df, output_path)
-    create_grouped_parquets(df)
+    author_path = get_datasets_dir("average_by_author.parquet")
+    party_path = get_datasets_dir("average_by_party.parquet")
+    image_cache = open_image_cache()
+
+    outputs_exist = output_path.exists() and author_path.exists() and party_path.exists()
+    if outputs_exist:
+        df_processed = read_processed_dataset(output_path)
+        # Outputs written before dates became datetime64 cannot be extended in place
+        outputs_exist = pd.api.types.is_datetime64_any_dtype(df_processed["date"])
+        if outputs_exist and "entities" not in df_processed:
+            # Written before the entities column: the rows are put in the canonical order and tagged
+            # with the untagged ones, nothing is rebuilt
+            df_processed["entities"] = None
+            df_processed = sort_cards(df_processed)
+
+    if verify and outputs_exist:
+        df_raw = load_dataset(input_path)
+        verify_incremental(df_raw, df_processed, load_dataset(author_path), load_dataset(party_path), image_cache)
+        image_cache.close()
+        return
+
+    if full_rebuild or not outputs_exist:
+        df, df_author, df_party = rebuild_all(load_dataset(input_path), image_cache)
+    else:
+        # Cards that are already processed are filtered out by the scan itself
+        df_raw = load_dataset(input_path, filters=~ds.field("id").isin(df_processed["id"].tolist()))
+        df, df_author, df_party = update_incremental(
+            df_raw, df_processed, load_dataset(author_path), load_dataset(party_path), image_cache
+        )
+    print('image cache:', image_cache.stats())
+    image_cache.close()
+
+    save_dataset(df, output_path, schema=PROCESSED_SCHEMA)
+    save_dataset(df_party, party_path)
+    save_dataset(df_author, author_path)
+    # Rebuilt from the in-memory rows in a single groupby, analysis.py only reads this cube
+    save_dataset(build_cube(df), get_datasets_dir(CUBE_FILE))
+    # Only cards whose ids are not indexed yet are tokenized, into a new index segment
+    update_search_index(df, full_rebuild=full_rebuild)
     print(df)  # Optional for debugging
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Process the scraped fact-checking cards.")
+    parser.add_argument("--full", action="store_true", help="rebuild every output from scratch")
+    parser.add_argument("--verify", action="store_true", help="check the incremental update against a full rebuild")
+    args = parser.parse_args()
+    main(full_rebuild=args.full, verify=args.verify)
@@ -1,99 +1,39 @@
+import asyncio
 import string
-import time
-from concurrent.futures import ThreadPoolExecutor
-from difflib import SequenceMatcher
 
 import pandas as pd
-import requests
-import spacy
-from bs4 import BeautifulSoup
 from nltk import word_tokenize
 from nltk.corpus import stopwords
 from nltk.sentiment.vader import SentimentIntensityAnalyzer
 from tabulate import tabulate
 
 import config
+from scripts.claim_matching import SentenceIndex, split_sentences
+from scripts.evidence_fetcher import EvidenceFetcher
+from scripts.nlp_models import ENGLISH_MODEL, NER_BATCH_SIZE, extract_entities_batch, load_model
+from scripts.path_operators import get_datasets_dir
+from scripts.rate_limiter import RATE_LIMITS_FILE, create_rate_limiters
+from scripts.response_cache import RESPONSE_CACHE_FILE, ResponseCache
+from scripts.schemas import read_processed_dataset
 
-
-class APIRateLimiter:
-    def __init__(self, max_calls_per_minute):
-        self.max_calls_per_minute = max_calls_per_minute
-        self.call_times = []
-
-    def can_make_call(self):
-        current_time = time.time()
-        self.call_times = [t for t in self.call_times if t > current_time - 60]
-        return len(self.call_times) < self.max_calls_per_minute
-
-    def record_call(self):
-        self.call_times.append(time.time())
+PROCESSED_FILE = "processed_fact_checking_with_scores.parquet"
 
 
 class DataFetcher:
     def __init__(self):
-        self.rate_limiter = APIRateLimiter(max_calls_per_minute=10)
-        self.nlp = self._load_spacy_model()
-
-    def _load_spacy_model(self):
-        try:
-            nlp = spacy.load("en_core_web_sm")
-        except OSError:
-            print("Downloading the spacy model...")
-            from spacy.cli import download
-
-            download("en_core_web_sm")
-            nlp = spacy.load("en_core_web_sm")
-        return nlp
-
-    def fetch_data_from_google_fact_check(self, claim):
-        api_key = config.GOOGLE_FACT_CHECK_API_KEY
-        search_url = f"https://factchecktools.googleapis.com/v1alpha1/claims:search?query={claim}&key={api_key}"
-
-        print(f"Making request to URL: {search_url}")  # Debugging information
-        if not self.rate_limiter.can_make_call():
-            print("Rate limit exceeded, waiting...")
-            time.sleep(60)  # Wait for a minute before retrying
-            if not self.rate_limiter.can_make_call():
-                return None
-
-        response = requests.get(search_url)
-        if response.status_code == 200:
-            self.rate_limiter.record_call()
-            claims = response.json().get("claims", [])
-            return claims
-        return None
-
-    def fetch_data_from_wikipedia(self, claim):
-        search_url = f"https://en.wikipedia.org/w/api.php?action=query&list=search&srsearch={claim}&utf8=&format=json"
-        response = requests.get(search_url)
-        if response.status_code == 200:
-            search_results = response.json().get("query", {}).get("search", [])
-            if search_results:
-                page_title = search_results[0]["title"]
-                page_url = (
-                    f"https://en.wikipedia.org/wiki/{page_title.replace(' ', '_')}"
-                )
-                page_response = requests.get(page_url)
-                if page_response.status_code == 200:
-                    return page_response.text
-        return None
-
-    def fetch_data_from_newsapi(self, claim):
-        api_key = config.NEWSAPI_KEY
-        search_url = f"https://newsapi.org/v2/everything?q={claim}&apiKey={api_key}"
-        response = requests.get(search_url)
-        if response.status_code == 200:
-            articles = response.json().get("articles", [])
-            return " ".join(
-                [article["content"] for article in articles if article["content"]]
-            )
-        return None
+        # Budgets shared by every process using the same file, e.g. several workers
+        self.rate_limiters = create_rate_limiters(db_path=get_datasets_dir(RATE_LIMITS_FILE))
+        # Shared by every DataFetcher in the process, loaded with only the NER pipes
+        self.nlp = load_model(ENGLISH_MODEL)
 
     def extract_entities(self, text):
         doc = self.nlp(text)
         entities = [(ent.text, ent.label_) for ent in doc.ents]
         return entities
 
+    def extract_entities_batch(self, texts, batch_size=NER_BATCH_SIZE, n_process=1):
+        return list(extract_entities_batch(texts, ENGLISH_MODEL, batch_size, n_process))
+
 
 class ClaimStandardizer:
 
@@ -120,36 +60,54 @@ class ClaimStandardizer:
 class ClaimAnalyzer:
     def __init__(self, services):
         self.data_fetcher = DataFetcher()
+        self.evidence_fetcher = EvidenceFetcher(
+            api_keys={
+                "google_fact_check": config.GOOGLE_FACT_CHECK_API_KEY,
+                "newsapi": config.NEWSAPI_KEY,
+            },
+            rate_limiters=self.data_fetcher.rate_limiters,
+            cache=ResponseCache(get_datasets_dir(RESPONSE_CACHE_FILE)),
+        )
         self.claim_standardizer = ClaimStandardizer
         self.services = services
 
     def analyze_claim(self, claim):
-        futures = {}
-        claim = self.claim_standardizer(claim).standardize()
-        print("Standardized claim: ", claim)
+        return asyncio.run(self.analyze_claim_async(claim))
 
-        with ThreadPoolExecutor() as executor:
-            if "wikipedia" in self.services:
-                futures["wikipedia"] = executor.submit(
-                    self.data_fetcher.fetch_data_from_wikipedia, claim
-                )
-            if "newsapi" in self.services:
-                futures["newsapi"] = executor.submit(
-                    self.data_fetcher.fetch_data_from_newsapi, claim
-                )
-            if "google_fact_check" in self.services:
-                futures["google_fact_check"] = executor.submit(
-                    self.data_fetcher.fetch_data_from_google_fact_check, claim
-                )
-
-            results = {service: future.result() for service, future in futures.items()}
+    def analyze_claims(self, claims):
+        # Many claims share one event loop and one connection pool
+        return asyncio.run(self.analyze_claims_async(claims))
 
+    async def analyze_claim_async(self, claim):
+        claim = self.claim_standardizer(claim).standardize()
+        print("Standardized claim: ", claim)
+        results = await self.evidence_fetcher.fetch_all(claim, self.services)
+        return self._build_result(claim, results)
+
+    async def analyze_claims_async(self, claims):
+        claims = [self.claim_standardizer(claim).standardize() for claim in claims]
+        all_results = await self.evidence_fetcher.fetch_many(claims, self.services)
+        return [self._build_result(claim, results) for claim, results in zip(claims, all_results)]
+
+    def warm_cache(self, titles):
+        """
+        Fetch the evidence for a list of claims ahead of time, so later analyses hit the cache.
+
+        :param titles: Claims to fetch, e.g. the titles of the processed cards
+        :return: Cache statistics after warming
+        """
+        # Keys are the standardized claims, so near-identical titles are fetched once
+        claims = list(dict.fromkeys(self.claim_standardizer(title).standardize() for title in titles))
+        asyncio.run(self.evidence_fetcher.fetch_many(claims, self.services))
+        stats = self.evidence_fetcher.cache.stats()
+        print(f"Cache warmed with {len(claims)} claims: {stats}")
+        return stats
+
+    def _build_result(self, claim, results):
         combined_data = ""
         if "wikipedia" in results:
-            combined_data += results["wikipedia"] or ""
-            if results["wikipedia"]:
-                soup = BeautifulSoup(results["wikipedia"], "html.parser")
-                combined_data += soup.get_text().lower()
+            # The extract is already plain text, no HTML left to strip
+            combined_data += (results["wikipedia"] or "").lower()
 
         if "newsapi" in results:
             combined_data += results["newsapi"] or ""
@@ -175,17 +133,10 @@ class ClaimAnalyzer:
         }
 
     def _find_matches(self, claim, claim_entities, combined_data):
-        doc = self.data_fetcher.nlp(combined_data.lower())
-        matches = []
-        for sent in doc.sents:
-            for ent_text, ent_label in claim_entities:
-                if ent_text.lower() in sent.text.lower():
-                    similarity = SequenceMatcher(
-                        None, claim.lower(), sent.text.lower()
-                    ).ratio()
-                    if similarity > 0.7:
-                        matches.append(sent)
-        return matches
+        # Only sentence boundaries are needed on the corpus side, and only sentences
+        # mentioning a claim entity are scored against the claim
+        index = SentenceIndex(split_sentences(combined_data.lower()))
+        return index.find_matches(claim, [ent_text for ent_text, ent_label in claim_entities])
 
 
 def get_sentiment_score(text):
@@ -257,6 +208,13 @@ def format_google_fact_check_results(fact_check_data):
     print(tabulate(df[["Claim Text", "Textual Rating", "Score"]], headers="keys"))
 
 
+def warm_cache_from_processed(services, limit=None):
+    # Most recent cards first, they are the ones most likely to be asked about
+    df = read_processed_dataset(get_datasets_dir(PROCESSED_FILE), columns=["title", "date"])
+    titles = df.sort_values("date", ascending=False)["title"].dropna().astype(str)
+    return ClaimAnalyzer(services).warm_cache(titles.head(limit) if limit else titles)
+
+
 def main():
     claim = input("Enter the claim to analyze: ")
     print("the claim is: ", claim)
@@ -265,6 +223,7 @@ def main():
     analyzer = ClaimAnalyzer(services)
     result = analyzer.analyze_claim(claim)
     print("result is: ", result)
+    print("response cache: ", analyzer.evidence_fetcher.cache.stats())
 
     # Print results for validation
     print("\nAnalysis Results:")
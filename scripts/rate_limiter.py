@@ -0,0 +1,161 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+RATE_LIMITS_FILE = "rate_limits.sqlite"
+# (calls, period in seconds) allowed for each external API
+API_BUDGETS = {
+    "google_fact_check": (10, 60),
+    "wikipedia": (200, 60),
+    "newsapi": (100, 24 * 60 * 60),
+}
+
+
+class LocalBucketState:
+    # Theoretical arrival time of one bucket, shared by the threads of a process
+    blocking = False
+
+    def __init__(self):
+        self.tat = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, decide):
+        with self._lock:
+            new_tat, result = decide(self.tat)
+            if new_tat is not None:
+                self.tat = new_tat
+            return result
+
+
+class SQLiteBucketState:
+    """
+    Theoretical arrival time of one bucket, stored in a SQLite file shared by several processes.
+
+    Every update is a single read-modify-write in an immediate transaction, so gunicorn
+    workers or parallel scripts draw from the same budget. The connection is reopened
+    after a fork, since SQLite connections must not cross process boundaries.
+    """
+
+    # An update may wait up to the busy timeout for another process to release the file
+    blocking = True
+
+    def __init__(self, db_path, name):
+        self.db_path = db_path
+        self.name = name
+        self._pid = None
+        self._connect()
+
+    def _connect(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        # Autocommit mode, so the transaction below is the only one
+        self.conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tat REAL NOT NULL)")
+
+    def update(self, decide):
+        if os.getpid() != self._pid:
+            self._connect()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT tat FROM buckets WHERE name = ?", (self.name,)).fetchone()
+                new_tat, result = decide(row[0] if row else 0.0)
+                if new_tat is not None:
+                    self.conn.execute("INSERT OR REPLACE INTO buckets (name, tat) VALUES (?, ?)", (self.name, new_tat))
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return result
+
+
+class RateLimiter:
+    """
+    Generic cell rate algorithm (GCRA), the token bucket reduced to one timestamp.
+
+    The only state is the theoretical arrival time (TAT) of the next call, so a check
+    is O(1) whatever the budget. A call reserves its slot before it is made, so calls
+    that fail or are still in flight count against the budget as well.
+    """
+
+    def __init__(self, calls, period=60, burst=None, name="default", db_path=None):
+        """
+        :param calls: Number of calls allowed per period
+        :param period: Length of the period in seconds
+        :param burst: Calls that can be made back to back, the whole budget by default
+        :param name: Bucket name, limiters with the same name and db_path share a budget
+        :param db_path: SQLite file shared across processes, None keeps the state in this process
+        """
+        self.interval = period / calls
+        self.tolerance = (burst or calls) * self.interval
+        self.name = name
+        self.state = SQLiteBucketState(db_path, name) if db_path else LocalBucketState()
+
+    def reserve(self, tokens=1, max_wait=None):
+        """
+        Reserve the next slot for a call.
+
+        :param tokens: Number of calls to reserve
+        :param max_wait: Longest acceptable wait in seconds, None waits as long as needed
+        :return: Seconds to wait before making the call, None if that exceeds max_wait (nothing is reserved)
+        """
+        # Wall-clock time, since the stored timestamps are compared across processes
+        now = time.time()
+
+        def decide(tat):
+            new_tat = max(tat, now) + tokens * self.interval
+            wait = max(new_tat - self.tolerance - now, 0.0)
+            if max_wait is not None and wait > max_wait:
+                return None, None
+            return new_tat, wait
+
+        return self.state.update(decide)
+
+    def try_acquire(self, tokens=1):
+        return self.reserve(tokens, max_wait=0) is not None
+
+    def acquire(self, tokens=1, timeout=None):
+        # Blocks only the calling thread, and only for its own reserved slot
+        wait = self.reserve(tokens, timeout)
+        if wait is None:
+            return False
+        if wait:
+            time.sleep(wait)
+        return True
+
+    async def acquire_async(self, tokens=1, timeout=None):
+        """
+        Wait for a slot without blocking the event loop.
+
+        :param tokens: Number of calls to reserve
+        :param timeout: Longest acceptable wait in seconds, None waits as long as needed
+        :return: True once the call may be made, False right away if the wait would exceed the timeout
+        """
+        if self.state.blocking:
+            # A shared file locked by another process would stall every task on the loop
+            wait = await asyncio.to_thread(self.reserve, tokens, timeout)
+        else:
+            wait = self.reserve(tokens, timeout)
+        if wait is None:
+            return False
+        if wait:
+            await asyncio.sleep(wait)
+        return True
+
+
+def create_rate_limiters(budgets=None, db_path=None):
+    """
+    Build one limiter per external API.
+
+    :param budgets: Dictionary from source to (calls, period), API_BUDGETS by default
+    :param db_path: SQLite file to share the budgets across processes, None for per-process budgets
+    :return: Dictionary from source to RateLimiter
+    """
+    budgets = {**API_BUDGETS, **(budgets or {})}
+    return {
+        source: RateLimiter(calls, period, name=source, db_path=db_path)
+        for source, (calls, period) in budgets.items()
+    }
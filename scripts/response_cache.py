@@ -0,0 +1,193 @@
+import itertools
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+HOUR_SECONDS = 60 * 60
+RESPONSE_CACHE_FILE = "response_cache.sqlite"
+# Seconds a response stays valid: fact checks and articles change faster than encyclopedia extracts
+SOURCE_TTLS = {
+    "google_fact_check": 24 * HOUR_SECONDS,
+    "wikipedia": 7 * 24 * HOUR_SECONDS,
+    "newsapi": 6 * HOUR_SECONDS,
+}
+DEFAULT_TTL = 24 * HOUR_SECONDS
+MEMORY_ENTRIES = 1024
+DISK_BYTES = 256 * 1024 * 1024
+
+
+class ResponseCache:
+    """
+    Two-tier cache of external API responses keyed by source and standardized claim.
+
+    A bounded in-memory LRU answers repeated claims without touching the disk, and a
+    SQLite store keeps responses across runs and processes. The store is bounded by the
+    total size of the responses; the least recently read ones are evicted first.
+    Failed lookups are never cached, so they are retried on the next request.
+
+    The memory tier has its own lock, so get_memory never waits for the disk and can be
+    called from an event loop; get and set may block on SQLite and belong on a worker thread.
+    """
+
+    def __init__(self, db_path, ttls=None, memory_entries=MEMORY_ENTRIES, disk_bytes=DISK_BYTES):
+        self.ttls = {**SOURCE_TTLS, **(ttls or {})}
+        self.memory_entries = memory_entries
+        self.disk_bytes = disk_bytes
+        self.memory = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # Seconds the cached responses took to fetch, summed over every hit
+        self.saved_seconds = 0.0
+        # _lock guards the SQLite connection, _memory_lock the memory tier and the counters. Code holding
+        # both takes _lock first
+        self._lock = threading.Lock()
+        self._memory_lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "source TEXT NOT NULL, claim TEXT NOT NULL, response TEXT NOT NULL, size INTEGER NOT NULL, "
+            "latency REAL NOT NULL, fetched_at REAL NOT NULL, read_at REAL NOT NULL, "
+            "PRIMARY KEY (source, claim))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_read_at ON responses (read_at)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_fetched_at ON responses (fetched_at)")
+        # Bytes stored, summed once and then kept up to date on every write. Rows written by other
+        # processes are counted the next time the store is opened
+        self.stored_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        # The store may have been filled under a larger bound or longer TTLs
+        self.evict()
+        self.conn.commit()
+
+    def ttl(self, source):
+        return self.ttls.get(source, DEFAULT_TTL)
+
+    def remember(self, key, entry):
+        # entry is (response, latency, expires_at), the caller holds _memory_lock
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def forget(self, keys):
+        with self._memory_lock:
+            for key in keys:
+                self.memory.pop(key, None)
+
+    def get_memory(self, source, claim):
+        """
+        Look up a response in the memory tier only.
+
+        :param source: Source name, e.g. "wikipedia"
+        :param claim: Standardized claim, as returned by ClaimStandardizer.standardize()
+        :return: Tuple (found, response)
+        """
+        key = (source, claim)
+        with self._memory_lock:
+            entry = self.memory.get(key)
+            if entry is None or entry[2] <= time.time():
+                return False, None
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            self.saved_seconds += entry[1]
+            return True, entry[0]
+
+    def get(self, source, claim):
+        """
+        Look up a response without fetching it, in memory first and then on disk.
+
+        :param source: Source name, e.g. "wikipedia"
+        :param claim: Standardized claim, as returned by ClaimStandardizer.standardize()
+        :return: Tuple (found, response)
+        """
+        found, response = self.get_memory(source, claim)
+        if found:
+            return True, response
+        key, now = (source, claim), time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT response, latency, fetched_at FROM responses WHERE source = ? AND claim = ?", key
+            ).fetchone()
+            if row is not None and now - row[2] <= self.ttl(source):
+                self.conn.execute("UPDATE responses SET read_at = ? WHERE source = ? AND claim = ?", (now, *key))
+                self.conn.commit()
+        with self._memory_lock:
+            if row is None or now - row[2] > self.ttl(source):
+                self.memory.pop(key, None)
+                self.misses += 1
+                return False, None
+            response, latency, fetched_at = json.loads(row[0]), row[1], row[2]
+            self.remember(key, (response, latency, fetched_at + self.ttl(source)))
+            self.disk_hits += 1
+            self.saved_seconds += latency
+            return True, response
+
+    def set(self, source, claim, response, latency=0.0):
+        """
+        Store a response in both tiers.
+
+        :param source: Source name
+        :param claim: Standardized claim
+        :param response: JSON-serializable response
+        :param latency: Seconds the response took to fetch, counted as saved on every later hit
+        """
+        key, now = (source, claim), time.time()
+        payload = json.dumps(response)
+        with self._memory_lock:
+            self.remember(key, (response, latency, now + self.ttl(source)))
+        with self._lock:
+            replaced = self.conn.execute("SELECT size FROM responses WHERE source = ? AND claim = ?", key).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (source, claim, response, size, latency, fetched_at, read_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (*key, payload, len(payload), latency, now, now),
+            )
+            self.stored_bytes += len(payload) - (replaced[0] if replaced else 0)
+            self.evict()
+            self.conn.commit()
+
+    def evict(self):
+        # Expired responses go first, then the least recently read ones until the store fits its size bound
+        now = time.time()
+        # Sources without a TTL of their own, e.g. dropped from the configuration, expire after the default one
+        cutoffs = {source: now - ttl for source, ttl in self.ttls.items()}
+        default_cutoff = now - DEFAULT_TTL
+        # The range on fetched_at uses its index, so only rows old enough to expire under some TTL are read
+        expired = self.conn.execute(
+            "DELETE FROM responses WHERE fetched_at < ? AND fetched_at < CASE source "
+            f"{'WHEN ? THEN ? ' * len(cutoffs)}ELSE ? END RETURNING source, claim, size",
+            (max(*cutoffs.values(), default_cutoff), *itertools.chain(*cutoffs.items()), default_cutoff),
+        ).fetchall()
+        self.forget((source, claim) for source, claim, size in expired)
+        self.stored_bytes -= sum(size for source, claim, size in expired)
+        excess = self.stored_bytes - self.disk_bytes
+        if excess <= 0:
+            return
+        # Read through the read_at index only as far as needed
+        rows = self.conn.execute("SELECT source, claim, size FROM responses ORDER BY read_at")
+        evicted = []
+        for source, claim, size in rows:
+            if excess <= 0:
+                break
+            evicted.append((source, claim))
+            excess -= size
+        rows.close()
+        self.conn.executemany("DELETE FROM responses WHERE source = ? AND claim = ?", evicted)
+        self.forget(evicted)
+        self.stored_bytes = excess + self.disk_bytes
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,59 @@
+import pandas as pd
+import pyarrow as pa
+
+from scripts.dataset_operators import read_dataset
+
+# Low-cardinality text is dictionary-encoded on disk and categorical in memory
+CATEGORICAL_COLUMNS = ["source", "author", "party", "orientation"]
+# Free text stays as strings, but Arrow-backed instead of Python objects
+ARROW_STRING_COLUMNS = ["id", "title", "read_more_link", "verdict"]
+
+ARROW_STRING_TYPES = {pa.string(): pd.StringDtype("pyarrow")}
+
+PROCESSED_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("title", pa.string()),
+    ("date", pa.date32()),
+    ("source", pa.dictionary(pa.int32(), pa.string())),
+    ("read_more_link", pa.string()),
+    ("author", pa.dictionary(pa.int32(), pa.string())),
+    ("party", pa.dictionary(pa.int32(), pa.string())),
+    ("verdict", pa.string()),
+    ("score", pa.int8()),
+    ("orientation", pa.dictionary(pa.int32(), pa.string())),
+    ("entities", pa.list_(pa.string())),
+])
+
+
+def enforce_processed_schema(df):
+    """
+    Cast a processed fact-checking DataFrame to the canonical in-memory dtypes.
+
+    Categories are rebuilt from the values, so frames assembled in different ways
+    (full rebuild, incremental concat, read from disk) end up with identical dtypes.
+
+    :param df: DataFrame with any subset of the processed columns
+    :return: DataFrame with categorical, Arrow string, int8 and datetime64 columns
+    """
+    df = df.copy()
+    for column in CATEGORICAL_COLUMNS:
+        if column in df:
+            values = df[column]
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype("category")
+            values = values.cat.remove_unused_categories()
+            df[column] = values.cat.reorder_categories(sorted(values.cat.categories))
+    for column in ARROW_STRING_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype("string[pyarrow]")
+    if "score" in df:
+        df["score"] = df["score"].astype("int8")
+    if "date" in df:
+        df["date"] = df["date"].astype("datetime64[ns]")
+    return df
+
+
+def read_processed_dataset(file_path, columns=None, filters=None):
+    # Strings are read straight into Arrow-backed columns, dictionaries into categoricals
+    df = read_dataset(file_path, columns=columns, filters=filters, types_mapper=ARROW_STRING_TYPES.get)
+    return enforce_processed_schema(df)
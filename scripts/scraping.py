@@ -1,8 +1,12 @@
+import argparse
 import hashlib
 import logging
+import math
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
+import requests
 from bs4 import BeautifulSoup
 from selenium import webdriver
 from selenium.common import NoSuchElementException, TimeoutException
@@ -13,18 +17,66 @@ from selenium.webdriver.support import expected_conditions as ec
 from selenium.webdriver.support.wait import WebDriverWait
 from webdriver_manager.chrome import ChromeDriverManager
 
-from scripts.path_operators import get_datasets_dir
+from scripts.dataset_operators import (
+    LEGACY_RAW_FILE,
+    RAW_DATASET,
+    append_fragment,
+    migrate_legacy_file,
+    read_dataset,
+)
+from scripts.http_operators import REQUEST_TIMEOUT, create_http_session
+from scripts.path_operators import get_datasets_dir, get_project_root
+
+try:
+    import lxml  # noqa: F401
 
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+# Anchored to the project root so the module can be imported from any working directory
+LOGS_DIR = get_project_root() / "logs"
+LOGS_DIR.mkdir(exist_ok=True)
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[logging.FileHandler("../logs/fact_checker.log"), logging.StreamHandler()],
+    handlers=[logging.FileHandler(LOGS_DIR / "fact_checker.log"), logging.StreamHandler()],
+)
+
+
+BASE_URL = "https://pagellapolitica.it"
+FACT_CHECKING_URL = f"{BASE_URL}/fact-checking"
+ARTICLE_WORKERS = 8
+
+# Where the verdict sits in the markup: the back of the card (revealed by "Vai al verdetto")
+# and the verdict box of the article page, whose class may be "verdetto" or "isVerdetto"
+VERDICT_SELECTORS = (
+    "h3.declaration.line-clamp-6.text-white",
+    "h3.declaration.text-white",
+    "[class*='verdetto' i] h3",
+    "[class*='verdetto' i] p",
 )
+# The body of an article page, as opposed to the related cards listed around it. Only checked against the
+# synthetic pages in fixtures/articles/ so far, check_captured_article_verdicts checks it on real ones
+ARTICLE_SELECTOR = "main article:not(.card)"
+VERDICT_WORKERS = 4
+# Consecutive already-known cards after which a crawl stops paginating
+KNOWN_CARDS_STOP = 20
+# Cards a regular crawl reads at most, a deep crawl has no cap unless one is given
+MAX_CARDS = 50
+CARD_TIME_BUDGET = 30
+
+# Returns the total number of cards in the DOM and the markup of those after the given index
+NEW_CARDS_SCRIPT = """
+const cards = document.querySelectorAll("li.col-span-4");
+return [cards.length, Array.from(cards).slice(arguments[0]).map((card) => card.outerHTML).join("")];
+"""
 
 
 def setup_driver():
     options = Options()
-    options.headless = True
+    # Options.headless is a no-op in Selenium 4.21, the flag has to be passed explicitly
+    options.add_argument("--headless=new")
     driver = webdriver.Chrome(
         service=Service(ChromeDriverManager().install()), options=options
     )
@@ -51,6 +103,26 @@ def handle_steady_floating_button(driver):
         logging.warning(f"No steady floating button: {e}")
 
 
+def open_fact_checking_page(driver, url=FACT_CHECKING_URL):
+    driver.get(url)
+    WebDriverWait(driver, 10).until(
+        ec.presence_of_element_located((By.CLASS_NAME, "col-span-4"))
+    )
+    handle_cookie_consent(driver)
+    handle_steady_floating_button(driver)
+
+
+def extract_verdict_from_markup(element, title=""):
+    # Returns "" when the markup holds no verdict, so the card falls back to the slower paths
+    for selector in VERDICT_SELECTORS:
+        verdict_element = element.select_one(selector)
+        if verdict_element:
+            verdict = verdict_element.get_text(strip=True)
+            if verdict and verdict != title:
+                return verdict
+    return ""
+
+
 def extract_fact_checking_cards_with_verdict(soup):
     cards = []
     card_elements = soup.find_all("li", class_="col-span-4 flex")
@@ -83,24 +155,47 @@ def extract_fact_checking_cards_with_verdict(soup):
             "read_more_link": read_more_element["href"] if read_more_element else "",
             "author": author_element.text.strip() if author_element else "",
             "party": party_element.text.strip() if party_element else "",
-            "verdict": "",
+            "verdict": extract_verdict_from_markup(article_nth, title),
         }
         cards.append(card_info)
     return cards
 
 
-def load_all_cards(driver, max_cards=None):
+def extract_new_cards(driver, processed_count):
+    # Only the cards appended since the last call are serialized and parsed
+    total_count, fragment = driver.execute_script(NEW_CARDS_SCRIPT, processed_count)
+    soup = BeautifulSoup(fragment, HTML_PARSER)
+    return total_count, extract_fact_checking_cards_with_verdict(soup)
+
+
+def load_all_cards(driver, max_cards=None, known_ids=None, stop_after_known=KNOWN_CARDS_STOP):
+    # The feed lists newest cards first: with known_ids, stop once a run of known cards shows we caught up
     all_cards = []
-    loaded_card_titles = set()
+    loaded_card_ids = set()
+    processed_count = 0
+    known_streak = 0
+    pages_loaded = 0
     while True:
-        soup = BeautifulSoup(driver.page_source, "html.parser")
-        new_cards = extract_fact_checking_cards_with_verdict(soup)
+        processed_count, new_cards = extract_new_cards(driver, processed_count)
+        pages_loaded += 1
         for card in new_cards:
-            if card["title"] not in loaded_card_titles:
+            if card["id"] not in loaded_card_ids:
                 all_cards.append(card)
-                loaded_card_titles.add(card["title"])
+                loaded_card_ids.add(card["id"])
+                known_streak = known_streak + 1 if known_ids and card["id"] in known_ids else 0
         if max_cards and len(all_cards) >= max_cards:
             break
+        if known_ids and known_streak >= stop_after_known:
+            if max_cards:
+                cards_per_page = len(all_cards) / pages_loaded
+                pages_saved = math.ceil((max_cards - len(all_cards)) / cards_per_page)
+                logging.info(
+                    f"Stopped after {known_streak} known cards in a row, {pages_loaded} pages loaded, "
+                    f"{pages_saved} fewer than reaching the cap of {max_cards} cards"
+                )
+            else:
+                logging.info(f"Stopped after {known_streak} known cards in a row, {pages_loaded} pages loaded")
+            break
         try:
             WebDriverWait(driver, 10).until(
                 ec.element_to_be_clickable(
@@ -114,15 +209,54 @@ def load_all_cards(driver, max_cards=None):
     return all_cards
 
 
-def find_verdict(driver, card, card_index):
+def extract_article_verdict(soup, title=""):
+    # Related cards carry the verdicts of other claims, so only the article body is searched
+    article = soup.select_one(ARTICLE_SELECTOR) or soup
+    for related_card in article.select("article.card"):
+        related_card.decompose()
+    return extract_verdict_from_markup(article, title)
+
+
+def fetch_verdict_from_article(session, card, base_url=BASE_URL):
+    if not card["read_more_link"]:
+        return card
+    try:
+        response = session.get(f"{base_url}{card['read_more_link']}", timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logging.warning(f"Could not fetch the article of '{card['title']}': {e}")
+        return card
+    card["verdict"] = extract_article_verdict(BeautifulSoup(response.content, HTML_PARSER), card["title"])
+    return card
+
+
+def fetch_verdicts_from_articles(cards, max_workers=ARTICLE_WORKERS, base_url=BASE_URL):
+    # Plain HTTP over a pooled session: milliseconds per card instead of a clicked Selenium round trip
+    start_time = time.time()
+    with create_http_session() as session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda card: fetch_verdict_from_article(session, card, base_url), cards))
+    found = sum(1 for card in cards if card["verdict"])
+    logging.info(
+        f"Found {found} of {len(cards)} verdicts in article pages in {time.time() - start_time:.2f} seconds"
+    )
+    return cards
+
+
+def find_verdict(driver, card, card_index, time_budget=None):
     title = card["title"]
     logging.info(f"Processing card {card_index} with title '{title}'")
-    try:
-        start_time = time.time()
+    start_time = time.time()
 
+    def wait_time():
+        # Each wait gets up to 10 seconds, capped by what is left of the card's time budget
+        if time_budget is None:
+            return 10
+        return max(0.1, min(10, time_budget - (time.time() - start_time)))
+
+    try:
         # Construct the XPath to find the article based on the title
         article_xpath = f'//h3[contains(text(),"{title}")]/ancestor::article'
-        article = WebDriverWait(driver, 10).until(
+        article = WebDriverWait(driver, wait_time()).until(
             ec.presence_of_element_located((By.XPATH, article_xpath))
         )
 
@@ -131,8 +265,9 @@ def find_verdict(driver, card, card_index):
         )
 
         # Find the button within the article and click it
-        verdict_button_xpath = "//button[contains(@class, 'pt-8') and .//div[contains(text(), 'Vai al verdetto')]]"
-        verdict_button = WebDriverWait(article, 10).until(
+        # Relative to the article: an absolute path would match the first card's button on the page
+        verdict_button_xpath = ".//button[contains(@class, 'pt-8') and .//div[contains(text(), 'Vai al verdetto')]]"
+        verdict_button = WebDriverWait(article, wait_time()).until(
             ec.element_to_be_clickable((By.XPATH, verdict_button_xpath))
         )
         verdict_button.click()
@@ -142,7 +277,7 @@ def find_verdict(driver, card, card_index):
         )
 
         # Wait for the verdict to appear, assume change in class or structure
-        WebDriverWait(driver, 10).until(
+        WebDriverWait(driver, wait_time()).until(
             lambda driver: "isVerdetto" in article.get_attribute("class")
         )
 
@@ -152,7 +287,7 @@ def find_verdict(driver, card, card_index):
 
         # Extract the verdict text from the updated article element
         verdict_xpath = ".//h3[contains(@class, 'declaration line-clamp-6') and contains(@class, 'text-white')]"
-        verdict_text_element = WebDriverWait(article, 10).until(
+        verdict_text_element = WebDriverWait(article, wait_time()).until(
             ec.visibility_of_element_located((By.XPATH, verdict_xpath))
         )
         card["verdict"] = verdict_text_element.text.strip()
@@ -177,55 +312,101 @@ def find_verdict(driver, card, card_index):
     return card
 
 
-def main():
-    df_existing = pd.DataFrame()
-    driver = setup_driver()
-    url = "https://pagellapolitica.it/fact-checking"
-    driver.get(url)
-    WebDriverWait(driver, 10).until(
-        ec.presence_of_element_located((By.CLASS_NAME, "col-span-4"))
+def extract_verdicts_worker(worker_id, indexed_cards, url, max_cards, time_budget, driver_factory):
+    start_time = time.time()
+    driver = driver_factory()
+    try:
+        open_fact_checking_page(driver, url)
+        # Paginate as far as the main crawl did so every card of the partition is in the DOM
+        load_all_cards(driver, max_cards)
+        for card_index, card in indexed_cards:
+            find_verdict(driver, card, card_index, time_budget)
+    except Exception as e:
+        # Cards left without a verdict are dropped and retried on the next run
+        logging.error(f"Worker {worker_id} stopped: {e}")
+    finally:
+        driver.quit()
+
+    elapsed = time.time() - start_time
+    logging.info(
+        f"Worker {worker_id} processed {len(indexed_cards)} cards in {elapsed:.2f} seconds "
+        f"({len(indexed_cards) / max(elapsed, 1e-6):.2f} cards/s)"
     )
-    handle_cookie_consent(driver)
-    handle_steady_floating_button(driver)
-    file_path = get_datasets_dir("fact_checking_with_verdict.parquet")
+
+
+def find_verdicts_parallel(cards, url=FACT_CHECKING_URL, max_cards=None, n_workers=VERDICT_WORKERS,
+                           time_budget=CARD_TIME_BUDGET, driver_factory=setup_driver):
+    # Cards are dealt round-robin to N independent driver sessions and updated in place, so order is kept
+    indexed_cards = list(enumerate(cards))
+    partitions = [indexed_cards[worker_id::n_workers] for worker_id in range(n_workers)]
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = [
+            executor.submit(extract_verdicts_worker, worker_id, partition, url, max_cards, time_budget, driver_factory)
+            for worker_id, partition in enumerate(partitions)
+            if partition
+        ]
+        for future in futures:
+            future.result()
+    return cards
+
+
+def main(deep_crawl=False, max_cards=None, stop_after_known=KNOWN_CARDS_STOP):
+    # max_cards defaults to MAX_CARDS for a regular crawl and to no cap for a deep crawl
+    if max_cards is None and not deep_crawl:
+        max_cards = MAX_CARDS
+    driver = setup_driver()
+    open_fact_checking_page(driver)
+    file_path = get_datasets_dir(RAW_DATASET)
+    migrate_legacy_file(get_datasets_dir(LEGACY_RAW_FILE), file_path)
     existing_ids = set()
     try:
-        df_existing = pd.read_parquet(file_path)
-        existing_ids = set(df_existing["id"])
+        existing_ids = set(read_dataset(file_path, columns=["id"])["id"])
         logging.info(f"Loaded {len(existing_ids)} existing IDs from {file_path}")
     except FileNotFoundError:
         logging.info(
             f"No existing file found at {file_path}. All IDs will be considered new."
         )
 
-    max_cards = 50
-    all_cards = load_all_cards(driver, max_cards)
+    # A deep crawl ignores the known ids and paginates up to max_cards, or to the last page without a cap
+    all_cards = load_all_cards(
+        driver, max_cards, known_ids=None if deep_crawl else existing_ids, stop_after_known=stop_after_known
+    )
+    driver.quit()
     new_cards = [card for card in all_cards if card["id"] not in existing_ids]
-    for i, card in enumerate(new_cards):
-        if card["verdict"] == "":
-            find_verdict(
-                driver, card, i
-            )  # Assuming the find_verdict function handles the entire process
+    logging.info(
+        f"{sum(1 for card in new_cards if card['verdict'])} of {len(new_cards)} verdicts found in the list markup"
+    )
+
+    # Article pages next, Selenium clicking only for the cards that are still missing a verdict
+    fetch_verdicts_from_articles([card for card in new_cards if card["verdict"] == ""])
+    pending_cards = [card for card in new_cards if card["verdict"] == ""]
+    find_verdicts_parallel(pending_cards, max_cards=len(all_cards))
 
-    driver.quit()
     new_cards = [card for card in new_cards if card["verdict"] != ""]
     df_new_cards = pd.DataFrame(new_cards)
     if not df_new_cards.empty:
-        if not df_existing.empty:
-            df_combined = pd.concat([df_existing, df_new_cards]).drop_duplicates(
-                subset="id"
-            )
-            df_combined.to_parquet(file_path, index=False, engine="pyarrow")
-            logging.info(
-                f"Appended {len(df_new_cards)} new cards. Total {len(df_combined)} entries now."
-            )
-        else:
-            df_new_cards.to_parquet(file_path, index=False, engine="pyarrow")
-            logging.info(f"Saved {len(df_new_cards)} new cards to {file_path}")
+        # Only the new cards are written, as a fresh fragment of the dataset
+        fragment_path = append_fragment(df_new_cards, file_path)
+        logging.info(
+            f"Appended {len(df_new_cards)} new cards to {fragment_path}. "
+            f"Total {len(existing_ids) + len(df_new_cards)} entries now."
+        )
     else:
         logging.info("No new cards to process.")
     logging.info(df_new_cards)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Scrape the latest fact-checking cards.")
+    parser.add_argument(
+        "--deep-crawl", action="store_true", help="keep paginating past cards that are already stored"
+    )
+    parser.add_argument(
+        "--max-cards", type=int, help=f"cards to read at most (default {MAX_CARDS}, no cap with --deep-crawl)"
+    )
+    parser.add_argument(
+        "--stop-after-known", type=int, default=KNOWN_CARDS_STOP,
+        help=f"stop after this many already stored cards in a row (default {KNOWN_CARDS_STOP})",
+    )
+    args = parser.parse_args()
+    main(deep_crawl=args.deep_crawl, max_cards=args.max_cards, stop_after_known=args.stop_after_known)
@@ -0,0 +1,294 @@
+import json
+import os
+import re
+import shutil
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+
+from scripts.path_operators import get_datasets_dir
+
+SEARCH_INDEX_DIR = "search_index"
+SEGMENT_PREFIX = "segment-"
+# Lists the live segments; readers only open these, so a segment is invisible until the manifest names it
+MANIFEST_FILE = "segments.json"
+# Times a reader re-reads the manifest when a compaction deletes the segments it listed
+OPEN_ATTEMPTS = 3
+SEGMENT_ARRAYS = ["ids", "doc_lengths", "terms", "offsets", "postings", "frequencies"]
+# Segments are merged once there are more than this many, so a query touches only a few
+MAX_SEGMENTS = 8
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Accent-folded, so "è" and "perché" match the tokens produced by fold_accents
+ITALIAN_STOPWORDS = frozenset("""
+    a ad agli ai al alla alle allo anche che chi ci coi col come con contro cui da dagli dai dal dalla dalle dallo
+    degli dei del dell della delle dello di dov dove e ed era erano essere gli ha hanno ho i il in io la le lei li
+    lo loro lui ma mi ne nei nel nell nella nelle nello noi non nostra nostro o per perche piu poi quale quando
+    quanto quella quelle quelli quello questa queste questi questo se sei si sia siamo sono stata stato su sua
+    sue sugli sui sul sull sulla sulle sullo suo suoi tra tu tutti tutto un una uno vi voi
+""".split())
+
+
+def fold_accents(text):
+    # NFKD splits "à" into "a" plus a combining accent, which the ASCII encoding drops
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+
+
+def light_stem(token):
+    # Drop the final vowel of longer words, so singular and plural forms (pensione, pensioni) match
+    return token[:-1] if len(token) > 4 and token[-1] in "aeio" else token
+
+
+def tokenize(text):
+    """
+    Split Italian text into search terms.
+
+    Text is lowercased and accent-folded, elisions like "dell'economia" are split on the
+    apostrophe, stopwords and single letters are dropped and the remaining words are lightly stemmed.
+
+    :param text: Text to tokenize
+    :return: List of terms, in order and with repetitions
+    """
+    tokens = TOKEN_PATTERN.findall(fold_accents(text.lower()))
+    return [light_stem(token) for token in tokens if len(token) > 1 and token not in ITALIAN_STOPWORDS]
+
+
+def build_segment_arrays(ids, texts):
+    """
+    Build the CSR postings of a batch of documents.
+
+    :param ids: Card ids, one per document
+    :param texts: Texts to index, one per document
+    :return: Dictionary of arrays; the postings of terms[t] are postings[offsets[t]:offsets[t + 1]]
+    """
+    vocabulary, term_ids, doc_lengths = {}, [], np.empty(len(texts), dtype=np.int32)
+    for doc, text in enumerate(texts):
+        tokens = tokenize(text)
+        doc_lengths[doc] = len(tokens)
+        term_ids.extend(vocabulary.setdefault(token, len(vocabulary)) for token in tokens)
+
+    # Terms are stored sorted, so a lookup is a binary search on the memory-mapped array
+    terms = np.array(sorted(vocabulary), dtype=str)
+    rank = np.empty(len(vocabulary), dtype=np.int64)
+    rank[[vocabulary[term] for term in terms]] = np.arange(len(terms))
+    docs = np.repeat(np.arange(len(texts), dtype=np.int64), doc_lengths)
+    keys, frequencies = np.unique(rank[np.array(term_ids, dtype=np.int64)] * len(texts) + docs, return_counts=True)
+    return postings_arrays(ids, doc_lengths, terms, keys // max(len(texts), 1), keys % max(len(texts), 1), frequencies)
+
+
+def postings_arrays(ids, doc_lengths, terms, posting_terms, posting_docs, frequencies):
+    return {
+        "ids": np.asarray(ids, dtype=str),
+        "doc_lengths": np.asarray(doc_lengths, dtype=np.int32),
+        "terms": terms,
+        "offsets": np.searchsorted(posting_terms, np.arange(len(terms) + 1)).astype(np.int64),
+        "postings": np.asarray(posting_docs, dtype=np.int32),
+        "frequencies": np.minimum(frequencies, np.iinfo(np.uint16).max).astype(np.uint16),
+    }
+
+
+def write_segment(arrays, path):
+    # Written aside and renamed, so readers never see a half-written segment
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.mkdir(parents=True)
+    for name in SEGMENT_ARRAYS:
+        np.save(tmp_path / f"{name}.npy", arrays[name])
+    tmp_path.rename(path)
+
+
+def read_manifest(path):
+    # Indexes written before the manifest have every segment directory live
+    try:
+        return json.loads((path / MANIFEST_FILE).read_text())["segments"]
+    except FileNotFoundError:
+        return [segment_path.name for segment_path in sorted(path.glob(f"{SEGMENT_PREFIX}*"))]
+
+
+def write_manifest(path, segment_names):
+    # Replaced with a single rename, so readers see either the old segments or the new ones, never both
+    tmp_path = path / f".{MANIFEST_FILE}.tmp"
+    tmp_path.write_text(json.dumps({"segments": segment_names}))
+    os.replace(tmp_path, path / MANIFEST_FILE)
+
+
+class IndexSegment:
+    """
+    Immutable, memory-mapped slice of the index covering one batch of documents.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Plain ndarray views over the mapped files, without the np.memmap subclass overhead on every slice
+        for name in SEGMENT_ARRAYS:
+            setattr(self, name, np.asarray(np.load(path / f"{name}.npy", mmap_mode="r")))
+        self.total_length = int(self.doc_lengths.sum())
+        self._average_length = None
+        self._length_norms = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def length_norms(self, average_length):
+        # BM25 length normalization of every document, recomputed only when the collection changes
+        if self._average_length != average_length:
+            self._length_norms = (BM25_K1 * (1 - BM25_B + BM25_B / average_length * self.doc_lengths)).astype(np.float32)
+            self._average_length = average_length
+        return self._length_norms
+
+    def lookup(self, term):
+        position = np.searchsorted(self.terms, term)
+        if position == len(self.terms) or self.terms[position] != term:
+            return None
+        return self.offsets[position], self.offsets[position + 1]
+
+
+class SearchIndex:
+    """
+    BM25 full-text index over the cards, stored as a directory of append-only segments.
+
+    New cards go into a new segment, so updates never rewrite what is already indexed.
+    Collection statistics (number of cards, average length, document frequencies) are
+    summed over the segments at query time, so scores don't depend on how cards were batched.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path or get_datasets_dir(SEARCH_INDEX_DIR))
+        self.segments = self.open_segments()
+
+    def open_segments(self):
+        # A compaction may delete the listed segments between reading the manifest and opening them
+        for attempt in range(OPEN_ATTEMPTS):
+            try:
+                return [IndexSegment(self.path / name) for name in read_manifest(self.path)]
+            except FileNotFoundError:
+                if attempt == OPEN_ATTEMPTS - 1:
+                    raise
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments)
+
+    def indexed_ids(self):
+        return np.concatenate([segment.ids for segment in self.segments]) if self.segments else np.array([], dtype=str)
+
+    def next_segment_path(self):
+        # Numbered past every directory on disk, live or left behind by an interrupted write
+        numbers = [int(p.name.removeprefix(SEGMENT_PREFIX)) for p in self.path.glob(f"{SEGMENT_PREFIX}*")]
+        return self.path / f"{SEGMENT_PREFIX}{max(numbers, default=0) + 1:06d}"
+
+    def save_manifest(self):
+        write_manifest(self.path, [segment.path.name for segment in self.segments])
+
+    def add(self, ids, texts):
+        """
+        Index the cards whose ids are not in the index yet.
+
+        :param ids: Card ids
+        :param texts: Texts to index, aligned with the ids
+        :return: Number of cards added
+        """
+        ids, texts = np.asarray(ids, dtype=str), list(texts)
+        new = ~np.isin(ids, self.indexed_ids())
+        if not new.any():
+            return 0
+        path = self.next_segment_path()
+        write_segment(build_segment_arrays(ids[new], [text for text, keep in zip(texts, new) if keep]), path)
+        self.segments.append(IndexSegment(path))
+        self.save_manifest()
+        if len(self.segments) > MAX_SEGMENTS:
+            self.compact()
+        return int(new.sum())
+
+    def compact(self):
+        # Merge every segment into one, remapping term and document numbers to the merged ones
+        if len(self.segments) < 2:
+            return
+        terms = np.unique(np.concatenate([segment.terms for segment in self.segments]))
+        posting_terms, posting_docs, frequencies = [], [], []
+        base = 0
+        for segment in self.segments:
+            global_terms = np.searchsorted(terms, segment.terms)
+            posting_terms.append(np.repeat(global_terms, np.diff(segment.offsets)))
+            posting_docs.append(segment.postings.astype(np.int64) + base)
+            frequencies.append(segment.frequencies)
+            base += len(segment)
+        posting_terms, posting_docs = np.concatenate(posting_terms), np.concatenate(posting_docs)
+        order = np.lexsort((posting_docs, posting_terms))
+        arrays = postings_arrays(
+            self.indexed_ids(),
+            np.concatenate([segment.doc_lengths for segment in self.segments]),
+            terms,
+            posting_terms[order],
+            posting_docs[order],
+            np.concatenate(frequencies)[order],
+        )
+        path = self.next_segment_path()
+        write_segment(arrays, path)
+        old_paths = [segment.path for segment in self.segments]
+        self.segments = [IndexSegment(path)]
+        # The merged segment goes live in the same rename that retires the old ones. Readers that
+        # already mapped an old segment keep reading it, the files stay until they are unmapped
+        self.save_manifest()
+        for old_path in old_paths:
+            shutil.rmtree(old_path)
+
+    def search(self, query, k=10):
+        """
+        Rank the cards against a query with BM25.
+
+        :param query: Free-text query, tokenized like the indexed texts
+        :param k: Number of results
+        :return: List of (card_id, score) tuples, best match first
+        """
+        terms = sorted(set(tokenize(query)))
+        n_docs = len(self)
+        if not terms or not n_docs:
+            return []
+        average_length = sum(segment.total_length for segment in self.segments) / n_docs
+
+        ranges = [[segment.lookup(term) for term in terms] for segment in self.segments]
+        document_frequencies = np.array([
+            sum(stop - start for start, stop in filter(None, (segment_ranges[i] for segment_ranges in ranges)))
+            for i in range(len(terms))
+        ])
+        idf = np.log1p((n_docs - document_frequencies + 0.5) / (document_frequencies + 0.5)).astype(np.float32)
+
+        candidates = []
+        for segment, segment_ranges in zip(self.segments, ranges):
+            scores = np.zeros(len(segment), dtype=np.float32)
+            length_norms = segment.length_norms(average_length)
+            matched = []
+            for term_idf, term_range in zip(idf, segment_ranges):
+                if term_range is None:
+                    continue
+                docs = segment.postings[term_range[0]:term_range[1]]
+                tf = segment.frequencies[term_range[0]:term_range[1]].astype(np.float32)
+                # Postings of a term hold each document once, so plain fancy-index addition is safe
+                scores[docs] += term_idf * (BM25_K1 + 1) * tf / (tf + length_norms[docs])
+                matched.append(docs)
+            if not matched:
+                continue
+            # Only the matched postings are ranked, never the whole score array. A document
+            # repeats once per matched term, so the top k * len(matched) entries hold the top k documents
+            matched = np.concatenate(matched)
+            if len(matched) > k * len(terms):
+                matched = matched[np.argpartition(scores[matched], -k * len(terms))[-k * len(terms):]]
+            candidates += [(str(segment.ids[doc]), float(scores[doc])) for doc in np.unique(matched)]
+        return sorted(candidates, key=lambda candidate: (-candidate[1], candidate[0]))[:k]
+
+
+def card_texts(df):
+    return (df["title"].astype(str) + " " + df["verdict"].astype(str)).tolist()
+
+
+def update_search_index(df, full_rebuild=False, path=None):
+    # Only cards whose ids are not indexed yet are tokenized
+    path = Path(path or get_datasets_dir(SEARCH_INDEX_DIR))
+    if full_rebuild and path.exists():
+        shutil.rmtree(path)
+    index = SearchIndex(path)
+    added = index.add(df["id"].astype(str).tolist(), card_texts(df))
+    print(f"search index: {added} cards added, {len(index)} indexed in {len(index.segments)} segments")
+    return index
@@ -1,51 +1,167 @@
+import hashlib
+import json
+import time
+from itertools import islice
+
 import firebase_admin
 import numpy as np
 import pandas as pd
 from firebase_admin import credentials, firestore
 
+from scripts.dataset_operators import read_dataset
 from scripts.path_operators import get_datasets_dir, get_firebase_key_path
+from scripts.schemas import read_processed_dataset
+
+
+# Firestore caps a single batched write at 500 operations
+FIRESTORE_BATCH_SIZE = 500
+
+MANIFEST_SUFFIX = "_manifest.parquet"
+
+
+def to_serializable_frame(df_instance):
+    # NaN/NaT become None for the whole frame at once, array cells become lists once per column
+    frame = df_instance.astype(object).where(df_instance.notna(), None)
+    for column in df_instance.select_dtypes(include="object").columns:
+        values = frame[column].dropna()
+        if not values.empty and isinstance(values.iloc[0], np.ndarray):
+            frame[column] = frame[column].map(lambda value: value.tolist() if isinstance(value, np.ndarray) else value)
+    return frame
+
+
+def iter_documents(df_instance, id_column, normalize_ids=False, chunk_size=FIRESTORE_BATCH_SIZE):
+    """
+    Yield Firestore-ready documents from a DataFrame without boxing every row into a Series.
+
+    :param df_instance: DataFrame to serialize
+    :param id_column: Column holding the document IDs
+    :param normalize_ids: Whether to turn IDs like "Mario Rossi" into "mario_rossi"
+    :param chunk_size: Number of rows materialized as dicts at a time
+    :return: Generator of (doc_id, data) tuples
+    """
+    doc_ids = df_instance[id_column].astype(str)
+    if normalize_ids:
+        doc_ids = doc_ids.str.replace(" ", "_").str.lower()
+    frame = to_serializable_frame(df_instance)
+    for start in range(0, len(frame), chunk_size):
+        records = frame.iloc[start:start + chunk_size].to_dict("records")
+        yield from zip(doc_ids.iloc[start:start + chunk_size], records)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def hash_document(data):
+    # Stable content hash of a converted row, independent of the key order
+    return hashlib.md5(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def load_manifest(collection_name):
+    manifest_path = get_datasets_dir(f"{collection_name}{MANIFEST_SUFFIX}")
+    if not manifest_path.exists():
+        return {}
+    manifest_df = pd.read_parquet(manifest_path)
+    return dict(zip(manifest_df["doc_id"], manifest_df["hash"]))
+
+
+def save_manifest(collection_name, manifest):
+    manifest_df = pd.DataFrame({"doc_id": list(manifest), "hash": list(manifest.values())})
+    manifest_df.to_parquet(get_datasets_dir(f"{collection_name}{MANIFEST_SUFFIX}"), index=False, engine="pyarrow")
 
 
 class FirebaseHandler:
-    def __init__(self, key_path):
-        self.cred = credentials.Certificate(key_path)
-        self.app = firebase_admin.initialize_app(self.cred)
-        self.db = firestore.client()
-
-    def upsert_data(self, df_instance, collection_name, id_column):
-        for index, row in df_instance.iterrows():
-            doc_id = row[id_column]
-            doc_ref = self.db.collection(collection_name).document(doc_id)
-
-            if not doc_ref.get().exists:  # Check if the document exists
-                data = row.to_dict()
-                data = self.convert_values(data)
-                doc_ref.set(data, merge=True)
-
-    def upsert_grouped_data(self, df_instance, collection_name, id_column):
-        for index, row in df_instance.iterrows():
-            doc_id = row[id_column].replace(" ", "_").lower()
-            doc_ref = self.db.collection(collection_name).document(doc_id)
-
-            data = row.to_dict()
-            data = self.convert_values(data)
-            doc_ref.set(data, merge=True)
-
-    def convert_values(self, data):
-        for key, value in data.items():
-            if isinstance(value, np.ndarray):
-                data[key] = value.tolist()
-            elif pd.isna(value):
-                data[key] = None
-        return data
+    def __init__(self, key_path=None, db=None):
+        # An explicit client (Firestore emulator or in-process fake) skips the app initialization
+        self.app = None
+        if db is None:
+            self.cred = credentials.Certificate(key_path)
+            self.app = firebase_admin.initialize_app(self.cred)
+            db = firestore.client()
+        self.db = db
+
+    def upsert_data(self, df_instance, collection_name, id_column, batch_size=FIRESTORE_BATCH_SIZE):
+        collection = self.db.collection(collection_name)
+        for chunk in chunked(iter_documents(df_instance, id_column), batch_size):
+            doc_refs = [collection.document(doc_id) for doc_id, data in chunk]
+
+            # Check the existence of the whole chunk in one round trip
+            existing_ids = {snapshot.id for snapshot in self.db.get_all(doc_refs) if snapshot.exists}
+            documents = [
+                (doc_ref, data)
+                for doc_ref, (doc_id, data) in zip(doc_refs, chunk)
+                if doc_id not in existing_ids
+            ]
+            self.write_batch(documents, collection_name)
+
+    def upsert_grouped_data(self, df_instance, collection_name, id_column, batch_size=FIRESTORE_BATCH_SIZE):
+        collection = self.db.collection(collection_name)
+        for chunk in chunked(iter_documents(df_instance, id_column, normalize_ids=True), batch_size):
+            self.write_batch([(collection.document(doc_id), data) for doc_id, data in chunk], collection_name)
+
+    def sync_data(self, df_instance, collection_name, id_column, normalize_ids=True, delete_missing=False,
+                  batch_size=FIRESTORE_BATCH_SIZE):
+        # Upload only the documents whose content hash differs from the local manifest of the last sync
+        manifest = load_manifest(collection_name)
+        collection = self.db.collection(collection_name)
+
+        current = {
+            doc_id: (hash_document(data), data)
+            for doc_id, data in iter_documents(df_instance, id_column, normalize_ids=normalize_ids)
+        }
+
+        changes = [
+            (doc_id, doc_hash, data)
+            for doc_id, (doc_hash, data) in current.items()
+            if manifest.get(doc_id) != doc_hash
+        ]
+        if delete_missing:
+            changes += [(doc_id, None, None) for doc_id in manifest if doc_id not in current]
+
+        try:
+            for start in range(0, len(changes), batch_size):
+                chunk = changes[start:start + batch_size]
+                self.write_batch(
+                    [(collection.document(doc_id), data) for doc_id, doc_hash, data in chunk], collection_name
+                )
+                for doc_id, doc_hash, data in chunk:
+                    if doc_hash is None:
+                        manifest.pop(doc_id, None)
+                    else:
+                        manifest[doc_id] = doc_hash
+        finally:
+            # Saved even when a batch fails, so the batches already committed are not written again
+            save_manifest(collection_name, manifest)
+        print(f"{collection_name}: {len(changes)} changed of {len(current)} documents")
+
+    def write_batch(self, documents, collection_name):
+        # Documents paired with None data are deleted
+        if not documents:
+            return
+        start_time = time.perf_counter()
+        batch = self.db.batch()
+        for doc_ref, data in documents:
+            if data is None:
+                batch.delete(doc_ref)
+            else:
+                batch.set(doc_ref, data, merge=True)
+        batch.commit()
+        elapsed = time.perf_counter() - start_time
+        print(
+            f"{collection_name}: wrote {len(documents)} documents in {elapsed:.2f}s "
+            f"({len(documents) / max(elapsed, 1e-6):.0f} docs/s)"
+        )
 
     def close(self):
-        firebase_admin.delete_app(self.app)
+        if self.app is not None:
+            firebase_admin.delete_app(self.app)
 
 
-def load_parquet(file_name):
+def load_parquet(file_name, columns=None, filters=None):
     file_path = get_datasets_dir(file_name)
-    return pd.read_parquet(file_path)
+    return read_dataset(file_path, columns=columns, filters=filters)
 
 
 def main():
@@ -53,18 +169,18 @@ def main():
     firebase_handler = FirebaseHandler(get_firebase_key_path())
 
     # Load datasets
-    main_df = load_parquet("processed_fact_checking_with_scores.parquet")
+    main_df = read_processed_dataset(get_datasets_dir("processed_fact_checking_with_scores.parquet"))
     party_df = load_parquet("average_by_party.parquet")
     author_df = load_parquet("average_by_author.parquet")
 
-    # Upsert main dataset
-    # firebase_handler.upsert_data(main_df, "fact_checking", "id")
+    # Sync main dataset, only new or modified cards are written
+    firebase_handler.sync_data(main_df, "fact_checking", "id", normalize_ids=False)
 
-    # Upsert party averages
-    # firebase_handler.upsert_grouped_data(party_df, "party_averages", "party")
+    # Sync party averages, dropping parties that no longer appear
+    firebase_handler.sync_data(party_df, "party_averages", "party", delete_missing=True)
 
-    # Upsert author averages
-    firebase_handler.upsert_grouped_data(author_df, "author_averages", "author")
+    # Sync author averages, dropping authors that no longer appear
+    firebase_handler.sync_data(author_df, "author_averages", "author", delete_missing=True)
 
     # Optionally print for debugging
     print(main_df.head())